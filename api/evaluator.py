@@ -1,89 +1,519 @@
-from api.gemini_client import GeminiClient
+from api.gemini_client import get_gemini_client
+from api.eval_cache import EvalCache, EVAL_CACHE_BYPASS
+from api.rate_limiter import estimate_tokens
+from api.metrics import span, FALLBACKS
+import asyncio
 import json
+import os
 import re
 
-class Evaluator:
+try:
+    # orjson parses evaluation replies several times faster; plain json works the same, just slower
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Batch evaluation: how much to pack into one prompt and how many prompts run at once
+EVAL_BATCH_TOKEN_BUDGET = int(os.getenv("EVAL_BATCH_TOKEN_BUDGET", "6000"))
+EVAL_BATCH_MAX_ITEMS = int(os.getenv("EVAL_BATCH_MAX_ITEMS", "20"))
+EVAL_BATCH_CONCURRENCY = int(os.getenv("EVAL_BATCH_CONCURRENCY", "4"))
+# Per-item output allowance (score + feedback + solution) when budgeting a batch
+EVAL_BATCH_ITEM_OUTPUT_TOKENS = 300
+
+# Ask Gemini for schema-constrained JSON (response_mime_type + response_schema) instead of prose-wrapped JSON
+EVAL_STRUCTURED_OUTPUT = os.getenv("EVAL_STRUCTURED_OUTPUT", "1") == "1"
+# One extra call to fix a reply that did not parse; 0 disables it
+EVAL_REPAIR_RETRIES = min(int(os.getenv("EVAL_REPAIR_RETRIES", "1")), 1)
+# Replies longer than this are rejected instead of scanned
+EVAL_MAX_RESPONSE_CHARS = 20000
+# How many '{' positions the fallback scan tries before giving up
+EVAL_MAX_JSON_CANDIDATES = 3
+
+# Gemini's schema subset (no minimum/maximum), so the 0-10 range is checked by validate_evaluation()
+EVALUATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "score": {"type": "INTEGER", "description": "0 to 10"},
+        "feedback": {"type": "STRING"},
+        "correct_solution": {"type": "STRING"},
+    },
+    "required": ["score", "feedback", "correct_solution"],
+}
+BATCH_EVALUATION_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "INTEGER"}, **EVALUATION_SCHEMA["properties"]},
+        "required": ["id"] + EVALUATION_SCHEMA["required"],
+    },
+}
+
+SCORE_PATTERN = re.compile(r'"score"\s*:\s*"?(-?\d+(?:\.\d+)?)"?\s*[,}\s]')
+FEEDBACK_START_PATTERN = re.compile(r'"feedback"\s*:\s*"')
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+_decoder = json.JSONDecoder()
+
+
+def validate_evaluation(data):
+    """Returns (normalized result, None), or (None, reason) if a required field is missing or out of range."""
+    if not isinstance(data, dict):
+        return None, "not a JSON object"
+    score = data.get("score")
+    if isinstance(score, str):
+        try:
+            score = float(score)
+        except ValueError:
+            return None, "score is not a number"
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return None, "score is missing"
+    if not 0 <= score <= 10:
+        return None, f"score {score} is outside 0-10"
+    feedback = data.get("feedback")
+    if not isinstance(feedback, str) or not feedback.strip():
+        return None, "feedback is missing"
+    solution = data.get("correct_solution")
+    if solution is not None and not isinstance(solution, str):
+        return None, "correct_solution is not a string"
+    return {
+        "score": int(score) if float(score).is_integer() else score,
+        "feedback": feedback,
+        "correct_solution": solution or "N/A",
+    }, None
+
+
+def _first_json(text, opener):
+    """
+    The first complete JSON value starting with `opener` ("{" or "[") in text,
+    trying at most EVAL_MAX_JSON_CANDIDATES start positions.
+    """
+    kind = dict if opener == "{" else list
+    pos = text.find(opener)
+    for _ in range(EVAL_MAX_JSON_CANDIDATES):
+        if pos < 0:
+            return None
+        try:
+            # raw_decode stops at the end of the value, so trailing prose is never scanned
+            obj, _ = _decoder.raw_decode(text, pos)
+            if isinstance(obj, kind):
+                return obj
+        except ValueError:
+            pass
+        pos = text.find(opener, pos + 1)
+    return None
+
+
+def _first_json_object(text):
+    return _first_json(text, "{")
+
+
+def parse_evaluation(text):
+    """
+    Bounded parse of an evaluation reply: the whole reply as JSON (what
+    structured output returns), else the first JSON object found in it.
+    Returns (result, None) or (None, reason).
+    """
+    text = (text or "").strip()
+    if not text:
+        return None, "empty response"
+    if len(text) > EVAL_MAX_RESPONSE_CHARS:
+        return None, f"response longer than {EVAL_MAX_RESPONSE_CHARS} chars"
+    try:
+        data = _loads(text)
+    except ValueError:
+        data = _first_json_object(text)
+        if data is None:
+            return None, "no JSON object in response"
+    return validate_evaluation(data)
+
+
+class StreamingEvaluationParser:
+    """
+    Incrementally scans a streamed evaluation JSON object.
+    feed() returns ("score", value) as soon as the score is complete and
+    ("feedback", text) deltas while the feedback string is still arriving.
+    """
+
     def __init__(self):
-        self.client = GeminiClient()
+        self.buffer = ""
+        self.score = None
+        self.feedback = ""
+        self._feedback_pos = None   # index in buffer of the next undecoded feedback char
+        self._feedback_done = False
 
-    def evaluate(self, question, user_answer, language="English"):
-        print(f"🚀 Evaluator: Analyzing answer...")
+    def feed(self, chunk):
+        self.buffer += chunk
+        events = []
+
+        if self.score is None:
+            match = SCORE_PATTERN.search(self.buffer)
+            if match:
+                value = float(match.group(1))
+                self.score = int(value) if value.is_integer() else value
+                events.append(("score", self.score))
+
+        if self._feedback_pos is None:
+            match = FEEDBACK_START_PATTERN.search(self.buffer)
+            if match:
+                self._feedback_pos = match.end()
+
+        if self._feedback_pos is not None and not self._feedback_done:
+            delta = self._decode_feedback()
+            if delta:
+                self.feedback += delta
+                events.append(("feedback", delta))
+        return events
+
+    def _decode_feedback(self):
+        out = []
+        pos = self._feedback_pos
+        buf = self.buffer
+        while pos < len(buf):
+            ch = buf[pos]
+            if ch == '"':
+                self._feedback_done = True
+                pos += 1
+                break
+            if ch == '\\':
+                # Leave incomplete escapes for the next chunk
+                if pos + 1 >= len(buf):
+                    break
+                esc = buf[pos + 1]
+                if esc == 'u':
+                    if pos + 6 > len(buf):
+                        break
+                    try:
+                        out.append(chr(int(buf[pos + 2:pos + 6], 16)))
+                    except ValueError:
+                        pass
+                    pos += 6
+                    continue
+                out.append(JSON_ESCAPES.get(esc, esc))
+                pos += 2
+                continue
+            out.append(ch)
+            pos += 1
+        self._feedback_pos = pos
+        return "".join(out)
 
-        # Check if client is available
-        if not self.client or not self.client.model:
-            return {
-                "score": 5,
-                "feedback": "AI evaluation is not available. Your answer has been recorded. Please ensure GOOGLE_API_KEY is configured for AI-powered feedback.",
-                "correct_solution": "N/A"
-            }
 
+class Evaluator:
+    def __init__(self, structured_output=EVAL_STRUCTURED_OUTPUT):
+        self.client = get_gemini_client()
+        self.cache = EvalCache()
+        self.structured_output = structured_output
+        self.counters = {"parsed": 0, "parse_failures": 0, "repairs": 0, "repaired": 0}
+
+    def generation_config(self, schema=EVALUATION_SCHEMA):
+        if not self.structured_output:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": schema}
+
+    def stats(self):
+        replies = self.counters["parsed"] + self.counters["parse_failures"]
+        return {
+            "structured_output": self.structured_output,
+            **self.counters,
+            "parse_failure_rate": round(self.counters["parse_failures"] / replies, 3) if replies else 0.0,
+            "repair_rate": round(self.counters["repairs"] / replies, 3) if replies else 0.0,
+            "repair_success_rate": round(self.counters["repaired"] / self.counters["repairs"], 3) if self.counters["repairs"] else 0.0,
+        }
+
+    def build_prompt(self, question, user_answer, language):
         # ✅ Your Prompt Structure
-        prompt = f"""
+        return f"""
         You are a Technical Interviewer.
-        
+
         Context:
         - Question: {question}
         - Candidate Answer: {user_answer}
-        
+
         Task:
         1. Compare the Candidate Answer with the technical facts.
         2. Provide feedback in the requested language: {language}.
-        
+
         Output Format (Strict JSON):
         {{
             "score": 0,
             "feedback": "...",
             "correct_solution": "..."
         }}
-        
+
         IMPORTANT: Return ONLY the JSON. No markdown formatting.
         """
 
-        response_text = self.client.generate(prompt)
+    def build_repair_prompt(self, response_text, reason):
+        return f"""
+        Your previous reply to a grading request could not be used ({reason}):
+
+        {response_text[:4000]}
+
+        Rewrite it as ONE JSON object with exactly these fields:
+        "score" (integer 0-10), "feedback" (string), "correct_solution" (string).
+        Keep the original content. Return ONLY the JSON. No markdown formatting.
+        """
+
+    def unavailable_result(self):
+        FALLBACKS.inc("eval_unavailable")
+        return {
+            "score": 5,
+            "feedback": "AI evaluation is not available. Your answer has been recorded. Please ensure GOOGLE_API_KEY is configured for AI-powered feedback.",
+            "correct_solution": "N/A"
+        }
+
+    def failure_result(self):
+        FALLBACKS.inc("eval_llm_failure")
+        # Check API key status for better error message
+        api_key_status = getattr(self.client, 'api_key_status', 'unknown')
+        if api_key_status == "invalid" or api_key_status == "invalid_format":
+            return {
+                "score": 5,
+                "feedback": "API key is invalid or not authorized. Please check your GOOGLE_API_KEY in Vercel settings. Your answer has been recorded.",
+                "correct_solution": "N/A"
+            }
+        elif api_key_status == "not_set":
+            return {
+                "score": 5,
+                "feedback": "API key is not configured. Please set GOOGLE_API_KEY environment variable in Vercel settings. Your answer has been recorded.",
+                "correct_solution": "N/A"
+            }
+        else:
+            # Rate limit or other API errors (client exists but API call failed)
+            return {
+                "score": 5,
+                "feedback": "AI service is temporarily unavailable (rate limit, quota exceeded, or service error). Your answer has been recorded. Please try again in a moment or check your API quota.",
+                "correct_solution": "N/A"
+            }
+
+    def parse_response(self, response_text):
+        """Returns (result, parsed_ok); a reply that does not parse gets a neutral score, not 0."""
+        result, reason = parse_evaluation(response_text)
+        if result is not None:
+            return result, True
+        print(f"❌ Parsing Error: {reason}")
+        FALLBACKS.inc("eval_parse_failure")
+        return {
+            "score": 5,
+            "feedback": (response_text or "").strip()[:200] or "Error parsing AI response.",
+            "correct_solution": "N/A"
+        }, False
+
+    async def _parse_or_repair(self, response_text):
+        """Parses a reply, spending at most EVAL_REPAIR_RETRIES extra calls on a repair prompt."""
+        with span("eval.parse"):
+            result, reason = parse_evaluation(response_text)
+        if result is None and EVAL_REPAIR_RETRIES:
+            self.counters["repairs"] += 1
+            print(f"⚠️ Evaluation reply unusable ({reason}) - asking for a repair")
+            repaired_text = await self.client.generate_async(self.build_repair_prompt(response_text, reason),
+                                                             generation_config=self.generation_config())
+            if repaired_text:
+                with span("eval.parse"):
+                    result, _ = parse_evaluation(repaired_text)
+                if result is not None:
+                    self.counters["repaired"] += 1
+                    response_text = repaired_text
+        if result is None:
+            self.counters["parse_failures"] += 1
+            return self.parse_response(response_text)
+        self.counters["parsed"] += 1
+        return result, True
+
+    async def _cache_lookup(self, question, user_answer, language, use_cache):
+        """Returns (cache_key, cached_result); cache_key is None when bypassing."""
+        # Identical (normalized) answers to the same question reuse an earlier evaluation
+        if use_cache and not EVAL_CACHE_BYPASS:
+            cache_key = EvalCache.make_key(question, user_answer, language, self.client.model_name)
+            return cache_key, await self.cache.get(cache_key)
+        self.cache.record_bypass()
+        return None, None
+
+    async def evaluate(self, question, user_answer, language="English", use_cache=True):
+        print(f"🚀 Evaluator: Analyzing answer...")
+
+        # Check if client is available
+        if not self.client or not self.client.available:
+            return self.unavailable_result()
+
+        cache_key, cached = await self._cache_lookup(question, user_answer, language, use_cache)
+        if cached is not None:
+            return cached
+
+        response_text = await self.client.generate_async(self.build_prompt(question, user_answer, language),
+                                                         generation_config=self.generation_config())
 
         # 1. Handle Network/API Failures
         if not response_text:
-            # Check API key status for better error message
-            api_key_status = getattr(self.client, 'api_key_status', 'unknown')
-            if api_key_status == "invalid" or api_key_status == "invalid_format":
-                return {
-                    "score": 5,
-                    "feedback": "API key is invalid or not authorized. Please check your GOOGLE_API_KEY in Vercel settings. Your answer has been recorded.",
-                    "correct_solution": "N/A"
-                }
-            elif api_key_status == "not_set":
-                return {
-                    "score": 5,
-                    "feedback": "API key is not configured. Please set GOOGLE_API_KEY environment variable in Vercel settings. Your answer has been recorded.",
-                    "correct_solution": "N/A"
-                }
-            else:
-                # Rate limit or other API errors (client exists but API call failed)
-                return {
-                    "score": 5,
-                    "feedback": "AI service is temporarily unavailable (rate limit, quota exceeded, or service error). Your answer has been recorded. Please try again in a moment or check your API quota.",
-                    "correct_solution": "N/A"
-                }
-
-        # 2. Robust JSON Parsing (Fixes "Could not process answer")
+            return self.failure_result()
+
+        result, parsed_ok = await self._parse_or_repair(response_text)
+        if parsed_ok and cache_key and isinstance(result, dict):
+            await self.cache.put(cache_key, result)
+        return result
+
+    async def evaluate_stream(self, question, user_answer, language="English", use_cache=True):
+        """
+        Async generator of (event, data) pairs: ("score", n) as soon as the score
+        has streamed in, ("feedback", delta) chunks, then ("result", full_result).
+        """
+        print(f"🚀 Evaluator: Streaming analysis...")
+
+        if not self.client or not self.client.available:
+            result = self.unavailable_result()
+        else:
+            cache_key, result = await self._cache_lookup(question, user_answer, language, use_cache)
+            if result is None:
+                parser = StreamingEvaluationParser()
+                chunks = []
+                async for chunk in self.client.stream_async(self.build_prompt(question, user_answer, language),
+                                                            generation_config=self.generation_config()):
+                    chunks.append(chunk)
+                    for event in parser.feed(chunk):
+                        yield event
+
+                if not chunks:
+                    result = self.failure_result()
+                    yield ("score", result["score"])
+                    yield ("feedback", result["feedback"])
+                else:
+                    result, parsed_ok = await self._parse_or_repair("".join(chunks))
+                    if parsed_ok and cache_key and isinstance(result, dict):
+                        await self.cache.put(cache_key, result)
+                yield ("result", result)
+                return
+
+        # Nothing to stream: emit the complete result at once
+        yield ("score", result.get("score", 0))
+        yield ("feedback", result.get("feedback", ""))
+        yield ("result", result)
+
+    def build_batch_prompt(self, items, language):
+        entries = "\n".join(
+            json.dumps({"id": i, "question": item["question"], "answer": item["answer"]}, ensure_ascii=False)
+            for i, item in items
+        )
+        return f"""
+        You are a Technical Interviewer grading several answers independently.
+
+        Candidate answers (one JSON object per line):
+        {entries}
+
+        Task:
+        For EACH line, compare the answer with the technical facts and give feedback in {language}.
+
+        Output Format (Strict JSON array, one object per input id):
+        [
+            {{"id": 0, "score": 0, "feedback": "...", "correct_solution": "..."}}
+        ]
+
+        IMPORTANT: Return ONLY the JSON array. No markdown formatting.
+        """
+
+    def pack_batches(self, items):
+        """Greedily groups (index, item) pairs so each prompt stays within the token budget."""
+        batches, current, used = [], [], 0
+        for pair in items:
+            cost = estimate_tokens(pair[1]["question"] + pair[1]["answer"], EVAL_BATCH_ITEM_OUTPUT_TOKENS)
+            if current and (used + cost > EVAL_BATCH_TOKEN_BUDGET or len(current) >= EVAL_BATCH_MAX_ITEMS):
+                batches.append(current)
+                current, used = [], 0
+            current.append(pair)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def parse_batch_response(self, response_text, ids):
+        """
+        Returns {id: result} for every item that passes validate_evaluation();
+        anything else is left out (and re-asked singly by evaluate_batch).
+        Same bounded strategy as parse_evaluation(), looking for an array.
+        """
+        text = (response_text or "").strip()
+        if not text or len(text) > EVAL_MAX_RESPONSE_CHARS * max(len(ids), 1):
+            return {}
         try:
-            # Use Regex to extract JSON object even if Gemini adds text around it
-            match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if match:
-                json_str = match.group(0)
-                return json.loads(json_str)
-            else:
-                # Fallback if no JSON found
-                return {
-                    "score": 0,
-                    "feedback": response_text[:200], # Return raw text as feedback
-                    "correct_solution": "N/A"
-                }
-
-        except Exception as e:
-            print(f"❌ Parsing Error: {e}")
-            return {
-                "score": 0,
-                "feedback": "Error parsing AI response.",
-                "correct_solution": "N/A"
-            }
\ No newline at end of file
+            # Structured output returns the bare array
+            entries = _loads(text)
+        except ValueError:
+            entries = _first_json(text, "[")
+            if entries is None:
+                print("❌ Batch Parsing Error: no JSON array in response")
+                return {}
+        results = {}
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or not isinstance(entry.get("id"), int) or entry["id"] not in ids or entry["id"] in results:
+                continue
+            result, _ = validate_evaluation(entry)
+            if result is not None:
+                results[entry["id"]] = result
+        return results
+
+    async def _evaluate_packed(self, batch, language, semaphore):
+        """{id: result} parsed from one batch call, or None if the call itself failed."""
+        ids = {i for i, _ in batch}
+        async with semaphore:
+            response_text = await self.client.generate_async(self.build_batch_prompt(batch, language),
+                                                             generation_config=self.generation_config(BATCH_EVALUATION_SCHEMA))
+        if not response_text:
+            return None
+        with span("eval.parse_batch"):
+            return self.parse_batch_response(response_text, ids)
+
+    async def evaluate_batch(self, items, use_cache=True):
+        """
+        Scores many answers with as few LLM calls as possible.
+        `items` is a list of dicts with question, answer and optional language.
+        Returns one result per item, in order. Items missing or malformed in a
+        batch response are retried on their own through evaluate().
+        """
+        print(f"🚀 Evaluator: Batch-analyzing {len(items)} answers...")
+        results = [None] * len(items)
+
+        if not self.client or not self.client.available:
+            return [self.unavailable_result() for _ in items]
+
+        # Cache hits never reach the LLM
+        pending = {}  # language -> [(index, item)]
+        cache_keys = {}
+        for i, item in enumerate(items):
+            language = item.get("language") or "English"
+            cache_key, cached = await self._cache_lookup(item["question"], item["answer"], language, use_cache)
+            if cached is not None:
+                results[i] = cached
+                continue
+            cache_keys[i] = cache_key
+            pending.setdefault(language, []).append((i, item))
+
+        semaphore = asyncio.Semaphore(EVAL_BATCH_CONCURRENCY)
+        jobs = []
+        for language, lang_items in pending.items():
+            for batch in self.pack_batches(lang_items):
+                jobs.append((batch, language, self._evaluate_packed(batch, language, semaphore)))
+        outcomes = await asyncio.gather(*(job for _, _, job in jobs))
+
+        retries = []
+        for (batch, language, _), parsed in zip(jobs, outcomes):
+            if parsed is not None:
+                # Per item, like _parse_or_repair, so parse_failure_rate covers batch replies too
+                self.counters["parsed"] += len(parsed)
+                self.counters["parse_failures"] += len(batch) - len(parsed)
+            for i, item in batch:
+                if parsed and i in parsed:
+                    results[i] = parsed[i]
+                    if cache_keys.get(i):
+                        await self.cache.put(cache_keys[i], parsed[i])
+                else:
+                    retries.append((i, item, language))
+
+        if retries:
+            print(f"⚠️ Retrying {len(retries)} batch items individually")
+
+            async def retry(i, item, language):
+                async with semaphore:
+                    results[i] = await self.evaluate(item["question"], item["answer"], language, use_cache=use_cache)
+
+            await asyncio.gather(*(retry(*r) for r in retries))
+        return results
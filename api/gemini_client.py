@@ -1,32 +1,142 @@
-import google.generativeai as genai
+import asyncio
+import hashlib
+import json
+import random
+import threading
 import time
 import os
 
+from api.single_flight import SingleFlight
+from api.rate_limiter import GeminiLimiter, estimate_tokens
+from api.metrics import span, record_stage, estimate_size, LLM_CALLS, LLM_RETRIES, PROMPT_TOKENS, RESPONSE_TOKENS
+
 # 🔑 YOUR API KEY
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Upper bound for a single Gemini call (seconds), per attempt
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+MAX_RETRIES = 3
+# Alternative REST endpoint, e.g. the stub server in benchmarks/stub_gemini.py
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+# Share one upstream call between concurrent identical prompts
+GEMINI_COALESCE = os.getenv("GEMINI_COALESCE", "1") == "1"
+# How long a coalesced caller waits on someone else's call before giving up
+GEMINI_COALESCE_TIMEOUT = float(os.getenv("GEMINI_COALESCE_TIMEOUT", "60"))
+
+_single_flight = SingleFlight()
+# Proactive RPM/TPM budget, AIMD concurrency cap and circuit breaker, shared by all clients
+_limiter = GeminiLimiter()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """One GeminiClient per process, shared by the question engine and the evaluator."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
+
+
+def gemini_stats():
+    """Process-wide Gemini client counters, for /health."""
+    return {"coalescing": _single_flight.stats(), "limiter": _limiter.stats()}
+
+
+def rpm_headroom():
+    """Request slots left in the (shared) RPM bucket right now."""
+    return _limiter.rpm.available()
+
+
+def limiter_outcome(error):
+    """How a failed call should feed back into the limiter and breaker."""
+    kind = classify_error(str(error))
+    if kind == "rate_limit":
+        return "throttled"
+    if kind == "other":
+        return "error"
+    return "ignored"  # auth / model errors say nothing about upstream health
+
+
+def classify_error(error_str):
+    """Buckets a Gemini exception message into auth / rate_limit / not_found / other."""
+    lowered = error_str.lower()
+    if "401" in error_str or "403" in error_str or "invalid" in lowered or "unauthorized" in lowered or "permission" in lowered or "api key" in lowered:
+        return "auth"
+    if "429" in error_str or "Quota" in error_str or "rate limit" in lowered or "quota exceeded" in lowered:
+        return "rate_limit"
+    if "404" in error_str or "not found" in lowered or "model" in lowered:
+        return "not_found"
+    return "other"
+
+
+async def _iterate_in_thread(iterable):
+    """Async iterator over a blocking iterator (a streamed REST response)."""
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
 
 class GeminiClient:
     def __init__(self):
-        self.model = None
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._model_failed = False
         self.model_name = 'gemini-1.5-flash'
         self.api_key_status = "not_set"
+        if not GOOGLE_API_KEY:
+            print("⚠️ GOOGLE_API_KEY not set - Gemini features will be disabled")
+            self.api_key_status = "not_set"
+            return
+
+        # Check if API key looks valid (basic format check)
+        if len(GOOGLE_API_KEY) < 20 or not GOOGLE_API_KEY.startswith("AIza"):
+            print("⚠️ GOOGLE_API_KEY format looks invalid (should start with 'AIza')")
+            self.api_key_status = "invalid_format"
+            return
+
+        self.api_key_status = "configured"  # Will be validated on first use
+
+    @property
+    def model(self):
+        """
+        The SDK model, created on first use. Importing google.generativeai costs
+        more than the rest of the app's imports together, so requests that never
+        reach Gemini (e.g. /health on a cold start) don't pay for it.
+        """
+        if self._model is None and not self._model_failed and self.api_key_status in ("configured", "valid"):
+            with self._model_lock:
+                if self._model is None and not self._model_failed:
+                    self._connect()
+        return self._model
+
+    @property
+    def available(self):
+        """Whether Gemini can be tried at all. Never imports the SDK, so it is safe on the event loop."""
+        return self._model is not None or (not self._model_failed and self.api_key_status in ("configured", "valid"))
+
+    async def model_async(self):
+        """self.model for async code: the first-use SDK import runs in a worker thread, not on the loop."""
+        if self._model is None and self.available:
+            await asyncio.to_thread(lambda: self.model)
+        return self._model
+
+    def _connect(self):
         try:
-            if not GOOGLE_API_KEY:
-                print("⚠️ GOOGLE_API_KEY not set - Gemini features will be disabled")
-                self.api_key_status = "not_set"
-                return
-            
-            # Check if API key looks valid (basic format check)
-            if len(GOOGLE_API_KEY) < 20 or not GOOGLE_API_KEY.startswith("AIza"):
-                print("⚠️ GOOGLE_API_KEY format looks invalid (should start with 'AIza')")
-                self.api_key_status = "invalid_format"
-                return
-            
-            genai.configure(api_key=GOOGLE_API_KEY)
-            self.model = genai.GenerativeModel(self.model_name)
+            import google.generativeai as genai
+            if GEMINI_API_ENDPOINT:
+                genai.configure(api_key=GOOGLE_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+            else:
+                genai.configure(api_key=GOOGLE_API_KEY)
+            self._model = genai.GenerativeModel(self.model_name)
             print(f"✅ Connected to {self.model_name}")
-            self.api_key_status = "configured"  # Will be validated on first use
-                    
         except Exception as e:
             error_str = str(e)
             if "401" in error_str or "403" in error_str or "invalid" in error_str.lower():
@@ -34,58 +144,255 @@ class GeminiClient:
                 self.api_key_status = "invalid"
             else:
                 print(f"❌ Connection Failed: {e}")
-            self.model = None
+            self._model_failed = True
+
+    async def _generate_content_async(self, prompt, generation_config=None, stream=False):
+        model = await self.model_async()
+        if not GEMINI_API_ENDPOINT:
+            return await model.generate_content_async(prompt, generation_config=generation_config, stream=stream)
+        # The SDK's async client does not work over the REST transport: run the sync call in a worker thread
+        response = await asyncio.to_thread(model.generate_content, prompt, generation_config=generation_config,
+                                           stream=stream, request_options={"timeout": GEMINI_TIMEOUT})
+        return _iterate_in_thread(response) if stream else response
+
+    def _coalesce_key(self, prompt, generation_config):
+        config = json.dumps(generation_config, sort_keys=True, default=str) if generation_config else ""
+        return hashlib.sha256(f"{self.model_name}\0{config}\0{prompt}".encode("utf-8")).hexdigest()
 
-    def generate(self, prompt: str):
+    def generate(self, prompt: str, generation_config=None):
         """
         Generates content with YOUR automatic retry logic.
+        Concurrent calls with the same prompt, model and config share one request.
         """
         if not self.model:
             return None  # Return None so caller can handle it appropriately
-        
+        if not GEMINI_COALESCE:
+            return self._generate(prompt, generation_config)
+        key = self._coalesce_key(prompt, generation_config)
+        return _single_flight.do(key, lambda: self._generate(prompt, generation_config), GEMINI_COALESCE_TIMEOUT)
+
+    def _generate(self, prompt, generation_config=None):
         # ⚡ FIX 2: Your Automatic Retry Logic
-        max_retries = 3
+        tokens = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(estimate_size(prompt))
         last_error = None
-        for attempt in range(max_retries):
+        for attempt in range(MAX_RETRIES):
+            with span("llm.limiter_wait"):
+                admitted = _limiter.acquire(tokens)
+            if not admitted:
+                print("⚠️ Gemini limiter: over budget or circuit open - using fallback")
+                LLM_CALLS.inc("rejected")
+                return None
+            outcome = "ignored"
             try:
                 # print(f"🚀 Sending request to Gemini (Attempt {attempt+1})...")
-                response = self.model.generate_content(prompt)
-                if response and response.text:
-                    # Mark API key as valid if we got a successful response
-                    if self.api_key_status == "configured":
-                        self.api_key_status = "valid"
-                    return response.text
-                else:
-                    print(f"⚠️ Empty response from Gemini")
-                    return None
+                with span("llm.call"):
+                    response = self.model.generate_content(prompt, generation_config=generation_config,
+                                                           request_options={"timeout": GEMINI_TIMEOUT})
+                outcome = "success"
+                return self._handle_response(response)
             
             except Exception as e:
-                error_str = str(e)
-                last_error = error_str
-                
-                # Check for API key authentication errors
-                if "401" in error_str or "403" in error_str or "invalid" in error_str.lower() or "unauthorized" in error_str.lower() or "permission" in error_str.lower() or "api key" in error_str.lower():
-                    print(f"❌ API Key Error (Invalid/Unauthorized): {e}")
-                    self.api_key_status = "invalid"  # Mark as invalid
-                    return None  # Don't retry for auth errors - API key is wrong
-                
-                # Check for quota/rate limit errors
-                elif "429" in error_str or "Quota" in error_str or "rate limit" in error_str.lower() or "quota exceeded" in error_str.lower():
-                    wait_time = 5 + (attempt * 2) 
-                    print(f"⚠️ Rate Limit/Quota Hit. Waiting {wait_time}s to retry...")
-                    if attempt < max_retries - 1:  # Don't sleep on last attempt
-                        time.sleep(wait_time)
-                
-                # Check for model not found errors
-                elif "404" in error_str or "not found" in error_str.lower() or "model" in error_str.lower():
-                    print(f"❌ Model not found: {e}")
-                    return None  # Don't retry for model errors
-                
-                # Other API errors
-                else:
-                    print(f"❌ API Error: {e}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2)  # Brief wait before retry
+                outcome = limiter_outcome(e)
+                last_error = str(e)
+                wait_time = self._handle_error(e, attempt)
+            finally:
+                _limiter.release(outcome)
+                LLM_CALLS.inc(outcome)
+
+            if wait_time is None:
+                return None
+            if wait_time:
+                with span("llm.retry_sleep"):
+                    time.sleep(wait_time)
         
         print(f"❌ All retries failed. Last error: {last_error}")
-        return None
\ No newline at end of file
+        return None
+
+    async def generate_async(self, prompt: str, timeout: float = GEMINI_TIMEOUT, generation_config=None):
+        """
+        Same retry policy as generate(), but awaits the SDK's async call and
+        backs off with asyncio.sleep so the event loop stays free.
+        Cancelling the awaiting task cancels the in-flight request, unless other
+        callers are coalesced onto it.
+        """
+        if not await self.model_async():
+            return None
+        if not GEMINI_COALESCE:
+            return await self._generate_async(prompt, timeout, generation_config)
+        key = self._coalesce_key(prompt, generation_config)
+        return await _single_flight.do_async(key, lambda: self._generate_async(prompt, timeout, generation_config),
+                                             GEMINI_COALESCE_TIMEOUT)
+
+    async def _generate_async(self, prompt, timeout=GEMINI_TIMEOUT, generation_config=None):
+        tokens = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(estimate_size(prompt))
+        last_error = None
+        for attempt in range(MAX_RETRIES):
+            with span("llm.limiter_wait"):
+                admitted = await _limiter.acquire_async(tokens)
+            if not admitted:
+                print("⚠️ Gemini limiter: over budget or circuit open - using fallback")
+                LLM_CALLS.inc("rejected")
+                return None
+            outcome = "ignored"
+            wait_time = 0
+            try:
+                with span("llm.call"):
+                    response = await asyncio.wait_for(self._generate_content_async(prompt, generation_config),
+                                                      timeout=timeout)
+                outcome = "success"
+                return self._handle_response(response)
+
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                outcome = "error"
+                last_error = f"Timed out after {timeout}s"
+                print(f"⚠️ Gemini call timed out after {timeout}s")
+                self._count_retry("timeout", attempt)
+            except Exception as e:
+                outcome = limiter_outcome(e)
+                last_error = str(e)
+                wait_time = self._handle_error(e, attempt)
+            finally:
+                _limiter.release(outcome)
+                LLM_CALLS.inc(outcome)
+
+            if wait_time is None:
+                return None
+            if wait_time:
+                with span("llm.retry_sleep"):
+                    await asyncio.sleep(wait_time)
+
+        print(f"❌ All retries failed. Last error: {last_error}")
+        return None
+
+    async def stream_async(self, prompt: str, timeout: float = GEMINI_TIMEOUT, generation_config=None):
+        """
+        Async generator over text chunks of a streamed generation.
+        Retries like generate_async() until the first chunk arrives; after that a
+        failure just ends the stream, since tokens already went to the caller.
+        Yields nothing if the call fails outright.
+        """
+        if not await self.model_async():
+            return
+
+        tokens = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(estimate_size(prompt))
+        last_error = None
+        for attempt in range(MAX_RETRIES):
+            with span("llm.limiter_wait"):
+                admitted = await _limiter.acquire_async(tokens)
+            if not admitted:
+                print("⚠️ Gemini limiter: over budget or circuit open - using fallback")
+                LLM_CALLS.inc("rejected")
+                return
+            started = False
+            streamed_chars = 0
+            call_started = time.perf_counter()
+            outcome = "ignored"
+            wait_time = 0
+            try:
+                response = await asyncio.wait_for(self._generate_content_async(prompt, generation_config, stream=True), timeout=timeout)
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                    except StopAsyncIteration:
+                        break
+                    text = self._chunk_text(chunk)
+                    if text:
+                        started = True
+                        streamed_chars += len(text)
+                        yield text
+                outcome = "success"
+                RESPONSE_TOKENS.observe(streamed_chars // 4)
+                if started and self.api_key_status == "configured":
+                    self.api_key_status = "valid"
+                return
+
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                outcome = "error"
+                last_error = f"Timed out after {timeout}s"
+                print(f"⚠️ Gemini stream timed out after {timeout}s")
+                if started:
+                    return
+                self._count_retry("timeout", attempt)
+            except Exception as e:
+                outcome = limiter_outcome(e)
+                last_error = str(e)
+                if started:
+                    print(f"❌ Stream interrupted: {e}")
+                    return
+                wait_time = self._handle_error(e, attempt)
+            finally:
+                _limiter.release(outcome)
+                LLM_CALLS.inc(outcome)
+                # The whole stream, first byte to last chunk
+                record_stage("llm.stream", time.perf_counter() - call_started)
+
+            if wait_time is None:
+                return
+            if wait_time:
+                with span("llm.retry_sleep"):
+                    await asyncio.sleep(wait_time)
+
+        print(f"❌ All retries failed. Last error: {last_error}")
+
+    @staticmethod
+    def _chunk_text(chunk):
+        # .text raises when a chunk carries no text part (e.g. safety or finish metadata)
+        try:
+            return chunk.text
+        except Exception:
+            return ""
+
+    def _handle_response(self, response):
+        if response and response.text:
+            # Mark API key as valid if we got a successful response
+            if self.api_key_status == "configured":
+                self.api_key_status = "valid"
+            RESPONSE_TOKENS.observe(estimate_size(response.text))
+            return response.text
+        print(f"⚠️ Empty response from Gemini")
+        return None
+
+    @staticmethod
+    def _count_retry(error_class, attempt):
+        if attempt < MAX_RETRIES - 1:
+            LLM_RETRIES.inc(error_class)
+
+    def _handle_error(self, e, attempt):
+        """
+        Returns how long to wait before retrying, 0 to retry immediately,
+        or None if the error is not worth retrying.
+        """
+        kind = classify_error(str(e))
+        last_attempt = attempt >= MAX_RETRIES - 1  # Don't sleep on last attempt
+
+        # Check for API key authentication errors
+        if kind == "auth":
+            print(f"❌ API Key Error (Invalid/Unauthorized): {e}")
+            self.api_key_status = "invalid"  # Mark as invalid
+            return None  # Don't retry for auth errors - API key is wrong
+        
+        # Check for quota/rate limit errors
+        if kind == "rate_limit":
+            # Jittered so workers that were throttled together don't retry together
+            wait_time = round((5 + (attempt * 2)) * random.uniform(0.5, 1.5), 1)
+            print(f"⚠️ Rate Limit/Quota Hit. Waiting {wait_time}s to retry...")
+            self._count_retry(kind, attempt)
+            return 0 if last_attempt else wait_time
+        
+        # Check for model not found errors
+        if kind == "not_found":
+            print(f"❌ Model not found: {e}")
+            return None  # Don't retry for model errors
+        
+        # Other API errors
+        print(f"❌ API Error: {e}")
+        self._count_retry(kind, attempt)
+        return 0 if last_attempt else 2  # Brief wait before retry
@@ -0,0 +1,48 @@
+import os
+import threading
+
+# How session_turns stores the answer and feedback text of new turns:
+# "json" keeps them as plain TEXT columns; "msgpack-zstd" packs both into one
+# zstd-compressed BLOB (needs the msgpack and zstandard packages).
+# Rows written either way are always readable.
+SESSION_TURN_CODEC = os.getenv("SESSION_TURN_CODEC", "json")
+SESSION_TURN_ZSTD_LEVEL = int(os.getenv("SESSION_TURN_ZSTD_LEVEL", "3"))
+CODECS = ("json", "msgpack-zstd")
+
+if SESSION_TURN_CODEC not in CODECS:
+    raise ValueError(f"SESSION_TURN_CODEC must be one of {CODECS}, got {SESSION_TURN_CODEC!r}")
+
+# First byte of every payload names its format, so a new one needs no migration
+FORMAT_MSGPACK_ZSTD = 1
+
+# zstandard (de)compressor objects must not be shared between threads
+_local = threading.local()
+
+
+def compact_enabled():
+    return SESSION_TURN_CODEC == "msgpack-zstd"
+
+
+def _zstd():
+    if not hasattr(_local, "compressor"):
+        import zstandard
+        _local.compressor = zstandard.ZstdCompressor(level=SESSION_TURN_ZSTD_LEVEL)
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.compressor, _local.decompressor
+
+
+def encode_turn_body(answer, feedback):
+    import msgpack
+    compressor, _ = _zstd()
+    return bytes([FORMAT_MSGPACK_ZSTD]) + compressor.compress(msgpack.packb([answer, feedback]))
+
+
+def decode_turn_body(payload):
+    """(answer, feedback) from a session_turns payload (bytes, or memoryview from a Postgres BYTEA)."""
+    payload = bytes(payload)
+    if payload[:1] == bytes([FORMAT_MSGPACK_ZSTD]):
+        import msgpack
+        _, decompressor = _zstd()
+        answer, feedback = msgpack.unpackb(decompressor.decompress(payload[1:]))
+        return answer, feedback
+    raise ValueError(f"Unknown session turn payload format {payload[:1]!r}")
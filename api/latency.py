@@ -0,0 +1,35 @@
+import threading
+from collections import deque
+
+WINDOW_SIZE = 1024
+
+
+class LatencyWindow:
+    """Keeps the most recent samples (seconds) and reports count and p50/p99 in ms."""
+
+    def __init__(self, size=WINDOW_SIZE):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    @staticmethod
+    def percentile(sorted_samples, pct):
+        if not sorted_samples:
+            return 0.0
+        idx = min(len(sorted_samples) - 1, int(round(pct / 100.0 * (len(sorted_samples) - 1))))
+        return sorted_samples[idx]
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        return {
+            "count": count,
+            "p50_ms": round(1000 * self.percentile(samples, 50), 3),
+            "p99_ms": round(1000 * self.percentile(samples, 99), 3),
+        }
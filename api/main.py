@@ -7,16 +7,24 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import uuid
-import uvicorn
 import json
+import asyncio
+import time
 
-from api.database import init_db, get_session, update_session, get_user_sessions
+from api.database import get_session, update_session, append_turn, get_user_sessions, pool_stats, session_cache_stats, SESSION_LIST_DEFAULT_LIMIT
 from api.question_engine import QuestionEngine
 from api.evaluator import Evaluator
 from api.difficulty_controller import DifficultyController
+from api.prefetch import QuestionPrefetcher
+from api.gemini_client import gemini_stats
+from api import metrics
+from api.metrics import span, FALLBACKS
 
 # For Vercel: When request comes to /api/start_interview, it routes to /api/main.py
 # The path that reaches FastAPI will be /api/start_interview
@@ -33,14 +41,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Request latency by route template, plus a Server-Timing header with the
+    per-stage breakdown (db, llm, parse, ...). Streaming responses send headers
+    before the body, so their Server-Timing only covers setup.
+    """
+    timings = metrics.start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.REQUEST_LATENCY.observe(elapsed, request.method, getattr(route, "path", "unmatched"), str(response.status_code))
+    response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    return response
+
 # --- INITIALIZATION ---
 print("🚀 Starting AI Interviewer Backend...")
-try:
-    init_db()
-    print("✅ Database initialized")
-except Exception as e:
-    print(f"⚠️ Database init warning: {e}")
-
+# Schema is checked on first database use (api.database.ensure_schema), not at import
 try:
     q_engine = QuestionEngine()
     print("✅ QuestionEngine initialized")
@@ -62,8 +81,24 @@ except Exception as e:
     print(f"⚠️ DifficultyController init warning: {e}")
     diff_controller = None
 
+prefetcher = QuestionPrefetcher(q_engine) if q_engine else None
+
 print("✅ Backend Ready!")
 
+@app.on_event("startup")
+async def warm_up_question_bank():
+    # Keep the embedding model load out of the first /get_question
+    if q_engine and q_engine.retrieval_first:
+        try:
+            await run_in_threadpool(q_engine.warm_up)
+        except Exception as e:
+            print(f"⚠️ Question bank warm-up failed: {e}")
+
+@app.on_event("shutdown")
+async def stop_question_pool():
+    if q_engine and q_engine.pool:
+        await q_engine.pool.stop()
+
 # --- MODELS ---
 class StartRequest(BaseModel):
     user_id: str
@@ -74,6 +109,51 @@ class AnswerRequest(BaseModel):
     session_id: str
     question_text: str
     answer: str
+    language: str = "English"
+    bypass_cache: bool = False
+
+# Upper bound on one /submit_answers request, so a single call cannot fan out unbounded Gemini evaluations
+SUBMIT_BATCH_MAX_ITEMS = int(os.getenv("SUBMIT_BATCH_MAX_ITEMS", "50"))
+
+class BatchAnswerRequest(BaseModel):
+    # More answers than this is a 422
+    answers: List[AnswerRequest] = Field(max_length=SUBMIT_BATCH_MAX_ITEMS)
+    bypass_cache: bool = False
+
+# --- HELPERS ---
+
+def session_topic_level(history):
+    """Topic and candidate level from the session's init meta entry."""
+    topic = "General Coding"
+    level = "Fresher"
+
+    if history and isinstance(history, list) and len(history) > 0:
+        if isinstance(history[0], dict):
+            topic = history[0].get("topic", "General Coding")
+            level = history[0].get("level", "Fresher")
+    return topic, level
+
+DISCONNECT_POLL_INTERVAL = 0.5
+
+async def run_unless_disconnected(request: Request, coro):
+    """
+    Awaits `coro` (an LLM call) but cancels it as soon as the client goes away,
+    so abandoned requests stop burning Gemini quota and retry sleeps.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                print("⚠️ Client disconnected - cancelled LLM call")
+                # 499: client closed request (nginx convention); never actually delivered
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
 
 # --- ENDPOINTS ---
 
@@ -97,59 +177,82 @@ def health_check():
             "question_engine": "ok" if q_engine else "not initialized",
             "evaluator": "ok" if evaluator else "not initialized",
             "difficulty_controller": "ok" if diff_controller else "not initialized"
-        }
+        },
+        "database_pool": pool_stats(),
+        "session_cache": session_cache_stats(),
+        "evaluation_cache": evaluator.cache.stats() if evaluator else None,
+        "evaluation_parsing": evaluator.stats() if evaluator else None,
+        "prefetch": prefetcher.stats() if prefetcher else None,
+        "question_source": q_engine.stats() if q_engine else None,
+        "gemini": gemini_stats()
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint (this worker process only)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/my_sessions/{user_id}")
-def get_my_sessions(user_id: str):
-    """Return a list of past interviews for the user."""
-    sessions = get_user_sessions(user_id)
-    return {"sessions": sessions}
+def get_my_sessions(user_id: str, limit: int = SESSION_LIST_DEFAULT_LIMIT, cursor: Optional[str] = None):
+    """Return a page of past interviews for the user, newest first."""
+    try:
+        sessions, next_cursor = get_user_sessions(user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
 @app.post("/start_interview")
-def start_interview(req: StartRequest):
+async def start_interview(req: StartRequest):
     session_id = str(uuid.uuid4())
     initial_history = [{"meta": "init", "topic": req.topic, "level": req.experience_level}]
-    update_session(session_id, "Easy", initial_history, user_id=req.user_id)
+    await run_in_threadpool(update_session, session_id, "Easy", initial_history, user_id=req.user_id)
+    if q_engine and q_engine.pool:
+        # Steers pool refills toward the topics and levels candidates actually pick
+        q_engine.pool.record_interview(req.topic, req.experience_level)
     print(f"✅ Session Started: {req.topic} | Level: {req.experience_level}")
     return {"session_id": session_id, "message": "Interview Started"}
 
 @app.get("/get_question/{session_id}")
-def get_next_question(session_id: str):
-    session_data = get_session(session_id)
+async def get_next_question(session_id: str, request: Request):
+    session_data = await run_in_threadpool(get_session, session_id)
     if not session_data:
         raise HTTPException(status_code=404, detail="Session not found")
     
     current_diff = session_data[0]
     history = session_data[1]
-    
-    topic = "General Coding"
-    level = "Fresher"
-
-    if history and isinstance(history, list) and len(history) > 0:
-        if isinstance(history[0], dict):
-            topic = history[0].get("topic", "General Coding")
-            level = history[0].get("level", "Fresher")
+    topic, level = session_topic_level(history)
 
     try:
-        if q_engine:
-            question_text = q_engine.get_question(topic, current_diff, level, history)
-        else:
-            question_text = f"Tell me about {topic} at {current_diff} level."
+        question_text = None
+        if prefetcher:
+            # Served instantly if /submit_answer already generated it (or waits on the in-flight task)
+            with span("question.prefetch"):
+                question_text = await run_unless_disconnected(request, prefetcher.take(session_id, current_diff, history))
+        if not question_text:
+            if q_engine:
+                with span("question.generate"):
+                    question_text = await run_unless_disconnected(request, q_engine.get_question(topic, current_diff, level, history))
+            else:
+                question_text = f"Tell me about {topic} at {current_diff} level."
         return {
             "question": question_text,
             "difficulty": current_diff,
             "topic": topic,
             "history": history
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
+        FALLBACKS.inc("question_error")
         return {"question": f"Tell me about {topic}.", "difficulty": "Easy", "topic": topic}
 
-@app.post("/submit_answer")
-def submit_answer(req: AnswerRequest):
-    if evaluator:
-        evaluation = evaluator.evaluate(req.question_text, req.answer)
+async def record_answer(session_id, session_data, question_text, answer, evaluation, prefetch=True):
+    """
+    Adjusts difficulty, appends the turn and kicks off the next-question prefetch.
+    Returns the /submit_answer response body.
+    """
+    if evaluation is not None:
         score = evaluation.get("score", 0)
         feedback = evaluation.get("feedback", "")
         correct_solution = evaluation.get("correct_solution", "")
@@ -158,10 +261,6 @@ def submit_answer(req: AnswerRequest):
         score = 5
         feedback = "Evaluation service not available. Please configure GOOGLE_API_KEY."
         correct_solution = "N/A"
-    
-    session_data = get_session(req.session_id)
-    if not session_data:
-        raise HTTPException(status_code=404, detail="Session not found")
 
     current_diff = session_data[0]
     history = session_data[1]
@@ -171,14 +270,19 @@ def submit_answer(req: AnswerRequest):
     else:
         new_diff = current_diff
     
-    history.append({
-        "question": req.question_text,
-        "answer": req.answer,
+    turn = {
+        "question": question_text,
+        "answer": answer,
         "score": score,
         "feedback": feedback
-    })
-    
-    update_session(req.session_id, new_diff, history, user_id=None)
+    }
+    await run_in_threadpool(append_turn, session_id, new_diff, turn)
+
+    # The next question's inputs are known now - start generating it while the candidate reads feedback
+    if prefetcher and prefetch:
+        history.append(turn)
+        topic, level = session_topic_level(history)
+        prefetcher.schedule(session_id, topic, new_diff, level, history)
     
     return {
         "score": score,
@@ -187,6 +291,133 @@ def submit_answer(req: AnswerRequest):
         "correct_solution": correct_solution
     }
 
+@app.post("/submit_answer")
+async def submit_answer(req: AnswerRequest, request: Request):
+    evaluation = None
+    if evaluator:
+        with span("evaluate"):
+            evaluation = await run_unless_disconnected(request, evaluator.evaluate(req.question_text, req.answer, req.language, use_cache=not req.bypass_cache))
+    
+    session_data = await run_in_threadpool(get_session, req.session_id)
+    if not session_data:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return await record_answer(req.session_id, session_data, req.question_text, req.answer, evaluation)
+
+@app.post("/submit_answers")
+async def submit_answers(req: BatchAnswerRequest):
+    """
+    Scores many answers in as few LLM calls as possible (take-home mode, re-grading).
+    Each result is recorded in its session exactly like /submit_answer, in the
+    order the answers were given.
+    """
+    # Unknown sessions fail the request before any evaluation spends quota
+    session_ids = list(dict.fromkeys(a.session_id for a in req.answers))
+    found = await asyncio.gather(*(run_in_threadpool(get_session, sid) for sid in session_ids))
+    missing = [sid for sid, data in zip(session_ids, found) if not data]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Session not found: {', '.join(missing)}")
+
+    items = [{"question": a.question_text, "answer": a.answer, "language": a.language} for a in req.answers]
+    if evaluator:
+        evaluations = await evaluator.evaluate_batch(items, use_cache=not req.bypass_cache)
+    else:
+        evaluations = [None] * len(items)
+
+    results = [None] * len(items)
+    by_session = {}
+    for i, a in enumerate(req.answers):
+        by_session.setdefault(a.session_id, []).append(i)
+
+    async def record_session(session_id, indexes):
+        # Sequential within a session so each answer sees the previous difficulty
+        for i in indexes:
+            session_data = await run_in_threadpool(get_session, session_id)
+            if not session_data:
+                results[i] = {"session_id": session_id, "error": "Session not found"}
+                continue
+            a = req.answers[i]
+            # Only the session's last answer leads to a question that will be asked
+            results[i] = await record_answer(session_id, session_data, a.question_text, a.answer, evaluations[i],
+                                             prefetch=i == indexes[-1])
+            results[i]["session_id"] = session_id
+
+    await asyncio.gather(*(record_session(sid, idx) for sid, idx in by_session.items()))
+    return {"results": results}
+
+# --- STREAMING (Server-Sent Events) ---
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.get("/get_question/{session_id}/stream")
+async def stream_next_question(session_id: str):
+    """
+    Streams the next question as `token` events, then a `done` event with the
+    same fields /get_question returns.
+    """
+    session_data = await run_in_threadpool(get_session, session_id)
+    if not session_data:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    current_diff = session_data[0]
+    history = session_data[1]
+    topic, level = session_topic_level(history)
+
+    async def events():
+        question_text = None
+        if prefetcher:
+            question_text = await prefetcher.take(session_id, current_diff, history)
+        if question_text:
+            yield sse_event("token", {"text": question_text})
+        elif q_engine:
+            parts = []
+            async for chunk in q_engine.stream_question(topic, current_diff, level, history):
+                parts.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            question_text = "".join(parts)
+        else:
+            question_text = f"Tell me about {topic} at {current_diff} level."
+            yield sse_event("token", {"text": question_text})
+
+        yield sse_event("done", {
+            "question": question_text,
+            "difficulty": current_diff,
+            "topic": topic,
+            "history": history
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/submit_answer/stream")
+async def stream_submit_answer(req: AnswerRequest):
+    """
+    Streams `score` as soon as the model emits it, then `feedback` deltas.
+    The turn is persisted once evaluation completes; the final `done` event
+    carries the same body as /submit_answer.
+    """
+    session_data = await run_in_threadpool(get_session, req.session_id)
+    if not session_data:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def events():
+        evaluation = None
+        if evaluator:
+            async for event, data in evaluator.evaluate_stream(req.question_text, req.answer, req.language, use_cache=not req.bypass_cache):
+                if event == "result":
+                    evaluation = data
+                elif event == "score":
+                    yield sse_event("score", {"score": data})
+                else:
+                    yield sse_event("feedback", {"text": data})
+
+        result = await record_answer(req.session_id, session_data, req.question_text, req.answer, evaluation)
+        yield sse_event("done", result)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 # Debug route to catch all unmatched paths
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
 async def catch_all(path: str, request: Request):
@@ -196,10 +427,11 @@ async def catch_all(path: str, request: Request):
         "received_path": path,
         "full_url": str(request.url),
         "method": request.method,
-        "available_routes": ["/", "/health", "/start_interview", "/get_question/{session_id}", "/submit_answer", "/my_sessions/{user_id}"],
+        "available_routes": ["/", "/health", "/metrics", "/start_interview", "/get_question/{session_id}", "/get_question/{session_id}/stream", "/submit_answer", "/submit_answer/stream", "/submit_answers", "/my_sessions/{user_id}"],
         "root_path": app.root_path,
         "vercel_env": os.getenv("VERCEL", "not set")
     }
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,145 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans range from sub-ms SQLite reads to multi-second Gemini calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Tokens (estimated)
+SIZE_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = _label_text(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            base = _label_text(self.labels, values)
+            lines.append(f"{self.name}_sum{base} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+STAGE_LATENCY = Histogram("stage_duration_seconds", "Time spent per request stage (db, llm, parse, ...).", ("stage",))
+LLM_CALLS = Counter("gemini_calls_total", "Gemini call attempts by outcome (success, throttled, error, ignored, rejected by the limiter).", ("outcome",))
+LLM_RETRIES = Counter("gemini_retries_total", "Gemini retries by error class.", ("error_class",))
+PROMPT_TOKENS = Histogram("gemini_prompt_tokens", "Estimated prompt size per Gemini call.", buckets=SIZE_BUCKETS)
+RESPONSE_TOKENS = Histogram("gemini_response_tokens", "Estimated response size per Gemini call.", buckets=SIZE_BUCKETS)
+FALLBACKS = Counter("fallback_total", "Requests served by a fallback path instead of the normal one.", ("path",))
+
+REGISTRY = (REQUEST_LATENCY, STAGE_LATENCY, LLM_CALLS, LLM_RETRIES, PROMPT_TOKENS, RESPONSE_TOKENS, FALLBACKS)
+
+# Per-request {stage: [total seconds, count]}, feeding the Server-Timing header.
+# Starlette's run_in_threadpool and asyncio.to_thread copy the context, so spans in worker threads land here too.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def estimate_size(text):
+    return len(text or "") // 4
+
+
+def start_request():
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def span(stage):
+    """Times a block into stage_duration_seconds and the current request's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage, seconds):
+    STAGE_LATENCY.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def timed(stage):
+    """Decorator form of span() for plain functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value; stage names use '.' which the header does not allow, so it becomes '-'."""
+    parts = []
+    for stage, (seconds, count) in timings.items():
+        desc = f';desc="{count} calls"' if count > 1 else ""
+        parts.append(f"{stage.replace('.', '-')};dur={1000 * seconds:.1f}{desc}")
+    if total is not None:
+        parts.append(f"total;dur={1000 * total:.1f}")
+    return ", ".join(parts)
+
+
+def render():
+    """All metrics in Prometheus text exposition format (per process)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
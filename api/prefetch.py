@@ -0,0 +1,109 @@
+import os
+import asyncio
+
+from api.database import save_prefetched_question, get_prefetched_question
+
+# How long /get_question will wait on an in-flight prefetch before generating itself
+PREFETCH_WAIT_TIMEOUT = float(os.getenv("PREFETCH_WAIT_TIMEOUT", "30"))
+PREFETCH_MAX_TASKS = int(os.getenv("PREFETCH_MAX_TASKS", "1000"))
+
+
+def count_turns(history):
+    return sum(1 for h in history or [] if not (isinstance(h, dict) and "meta" in h))
+
+
+class QuestionPrefetcher:
+    """
+    Generates a session's next question in the background as soon as an answer
+    is recorded, so /get_question can return without waiting on Gemini.
+
+    A prefetch is tagged with the number of answered turns and the difficulty it
+    was generated for; it is discarded if either has changed by the time it is used.
+    """
+
+    def __init__(self, q_engine):
+        self.q_engine = q_engine
+        self._tasks = {}  # session_id -> (turns, difficulty, task)
+        self.counters = {
+            "scheduled": 0,
+            "inflight_hits": 0,
+            "stored_hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "failed": 0,
+        }
+
+    def schedule(self, session_id, topic, difficulty, level, history):
+        turns = count_turns(history)
+        previous = self._tasks.pop(session_id, None)
+        if previous and not previous[2].done():
+            previous[2].cancel()
+        self._prune()
+
+        task = asyncio.create_task(self._generate(session_id, topic, difficulty, level, history, turns))
+        self._tasks[session_id] = (turns, difficulty, task)
+        self.counters["scheduled"] += 1
+
+    async def _generate(self, session_id, topic, difficulty, level, history, turns):
+        try:
+            question = await self.q_engine.get_question(topic, difficulty, level, history)
+            # Persist so a different worker (or a later cold start) can serve it
+            await asyncio.to_thread(save_prefetched_question, session_id, question, turns, difficulty)
+            return question
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Prefetch failed: {e}")
+            self.counters["failed"] += 1
+            return None
+
+    def _prune(self):
+        if len(self._tasks) < PREFETCH_MAX_TASKS:
+            return
+        for session_id in [s for s, (_, _, t) in self._tasks.items() if t.done()]:
+            del self._tasks[session_id]
+
+    async def take(self, session_id, difficulty, history):
+        """Returns a prefetched question valid for this session state, or None."""
+        turns = count_turns(history)
+        stale = False
+
+        entry = self._tasks.pop(session_id, None)
+        if entry:
+            entry_turns, entry_difficulty, task = entry
+            if entry_turns == turns and entry_difficulty == difficulty:
+                try:
+                    question = await asyncio.wait_for(asyncio.shield(task), timeout=PREFETCH_WAIT_TIMEOUT)
+                    if question:
+                        self.counters["inflight_hits"] += 1
+                        return question
+                except asyncio.TimeoutError:
+                    task.cancel()
+                except asyncio.CancelledError:
+                    # Only swallow the prefetch task's own cancellation, not ours
+                    if not task.cancelled():
+                        raise
+            else:
+                task.cancel()
+                stale = True
+
+        stored = await asyncio.to_thread(get_prefetched_question, session_id)
+        if stored:
+            question, stored_turns, stored_difficulty = stored
+            if stored_turns == turns and stored_difficulty == difficulty:
+                self.counters["stored_hits"] += 1
+                return question
+            stale = True
+
+        if stale:
+            self.counters["stale"] += 1
+        self.counters["misses"] += 1
+        return None
+
+    def stats(self):
+        stats = dict(self.counters)
+        hits = stats["inflight_hits"] + stats["stored_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        stats["in_flight"] = sum(1 for _, _, t in self._tasks.values() if not t.done())
+        return stats
@@ -1,16 +1,37 @@
-from api.gemini_client import GeminiClient
+from api.gemini_client import get_gemini_client
+from api.context_builder import ContextBuilder, count_tokens
+from api.latency import LatencyWindow
+from api.metrics import timed, FALLBACKS
+from api.question_pool import QuestionPool, QUESTION_POOL_ENABLED
+import asyncio
+import json
+import os
+import time
+
+# Serve questions from the RAG question bank first and call Gemini only as a fallback
+QUESTION_RETRIEVAL_FIRST = os.getenv("QUESTION_RETRIEVAL_FIRST", "0") == "1"
+# Below this cosine similarity a bank question is not considered a good fit
+QUESTION_BANK_MIN_SIMILARITY = float(os.getenv("QUESTION_BANK_MIN_SIMILARITY", "0.35"))
+QUESTION_BANK_CANDIDATES = 5
+# Structured output for pool refills: a bare JSON array of question strings
+QUESTION_BATCH_SCHEMA = {"type": "ARRAY", "items": {"type": "STRING"}}
 
 class QuestionEngine:
-    def __init__(self):
-        self.client = GeminiClient()
+    def __init__(self, retrieval_first=QUESTION_RETRIEVAL_FIRST, use_pool=QUESTION_POOL_ENABLED):
+        self.client = get_gemini_client()
+        self.retrieval_first = retrieval_first
+        self.pool = QuestionPool(self) if use_pool else None
+        self._vector_store = None
+        self._vector_store_failed = False
+        self.counters = {"bank_hits": 0, "bank_misses": 0, "pool_hits": 0, "llm": 0, "fallback": 0}
+        self.latency = {"bank": LatencyWindow(), "llm": LatencyWindow()}
+        self.context = ContextBuilder()
+        self.prompt_tokens = {"prompts": 0, "tokens": 0}
 
-    def get_question(self, topic, difficulty, level, history):
+    def build_prompt(self, topic, difficulty, level, history):
         # Construct a prompt for the AI
-        history_text = ""
-        if history:
-            # Summarize last few interactions to keep context
-            recent = history[-3:] 
-            history_text = f"Recent conversation: {recent}"
+        # Compact, token-budgeted summary of the session rather than raw turns
+        history_text = self.context.build(history)
 
         prompt = f"""
         You are a technical interviewer.
@@ -19,15 +40,160 @@ class QuestionEngine:
         Candidate Level: {level}
         {history_text}
         Generate the next interview question. Keep it concise and relevant. Do not include the answer.
+        Do not repeat a question that was already asked.
+        """
+        self.prompt_tokens["prompts"] += 1
+        self.prompt_tokens["tokens"] += count_tokens(prompt)
+        return prompt
+
+    def build_batch_prompt(self, topic, difficulty, level, count):
+        return f"""
+        You are a technical interviewer.
+        Topic: {topic}
+        Difficulty: {difficulty}
+        Candidate Level: {level}
+        Generate {count} different opening interview questions for this candidate, each concise and self-contained.
+        Do not include the answers.
+        Output strictly as a JSON array of question strings (no markdown).
         """
-        
-        if not self.client or not self.client.model:
+
+    async def generate_batch(self, topic, difficulty, level, count):
+        """Up to `count` questions from one LLM call (for the question pool); [] on failure."""
+        if not self.client or not self.client.available:
+            return []
+        response = await self.client.generate_async(
+            self.build_batch_prompt(topic, difficulty, level, count),
+            generation_config={"response_mime_type": "application/json", "response_schema": QUESTION_BATCH_SCHEMA},
+        )
+        try:
+            questions = json.loads(response or "[]")
+        except ValueError:
+            print("⚠️ Question batch was not a JSON array")
+            return []
+        if not isinstance(questions, list):
+            return []
+        return [q.strip() for q in questions if isinstance(q, str) and q.strip()][:count]
+
+    @staticmethod
+    def asked_questions(history):
+        return {h.get("question") for h in history or [] if isinstance(h, dict) and h.get("question")}
+
+    @staticmethod
+    def is_opening(history):
+        """True before the first answered turn. Pooled questions are history-free, so only these may use the pool."""
+        return not any(isinstance(h, dict) and h.get("question") for h in history or [])
+
+    def fallback_question(self, topic, difficulty, level):
+        FALLBACKS.inc("question_template")
+        return f"Explain the concept of {topic} at a {difficulty.lower()} level. What are the key aspects a {level} should know?"
+
+    @property
+    def vector_store(self):
+        """The question bank index, loaded on first use (None if RAG deps are missing)."""
+        if self._vector_store is None and not self._vector_store_failed:
+            try:
+                from api.rag.vector_store import VectorStore
+                self._vector_store = VectorStore()
+                print("✅ Question bank loaded")
+            except Exception as e:
+                print(f"⚠️ Question bank unavailable - using Gemini only: {e}")
+                self._vector_store_failed = True
+        return self._vector_store
+
+    def warm_up(self):
+        """Loads the bank and its embedding model ahead of the first request (retrieval-first only)."""
+        if not self.retrieval_first:
+            return
+        store = self.vector_store
+        if store is not None:
+            store.embedder.warm_up()
+
+    @timed("question.bank_search")
+    def pick_bank_question(self, topic, difficulty, history):
+        """Best unseen bank question for this session, or None if nothing clears the threshold."""
+        store = self.vector_store
+        if store is None:
+            return None
+
+        asked = self.asked_questions(history)
+        recent = [h["question"] for h in (history or [])[-2:] if isinstance(h, dict) and h.get("question")]
+        query = " ".join([topic, difficulty] + recent)
+
+        for similarity, item in store.search(query, k=QUESTION_BANK_CANDIDATES, difficulty=difficulty, topic=topic, exclude=asked):
+            if similarity >= QUESTION_BANK_MIN_SIMILARITY:
+                return item["question"]
+        return None
+
+    async def get_question(self, topic, difficulty, level, history):
+        if self.retrieval_first:
+            started = time.perf_counter()
+            question = await asyncio.to_thread(self.pick_bank_question, topic, difficulty, history)
+            if question:
+                self.counters["bank_hits"] += 1
+                self.latency["bank"].record(time.perf_counter() - started)
+                return question
+            self.counters["bank_misses"] += 1
+
+        if self.pool and self.is_opening(history):
+            question = await self.pool.take(topic, difficulty, level)
+            if question:
+                self.counters["pool_hits"] += 1
+                return question
+
+        prompt = self.build_prompt(topic, difficulty, level, history)
+
+        if not self.client or not self.client.available:
             # Fallback question if API is not configured
-            return f"Explain the concept of {topic} at a {difficulty.lower()} level. What are the key aspects a {level} should know?"
-        
-        response = self.client.generate(prompt)
+            self.counters["fallback"] += 1
+            return self.fallback_question(topic, difficulty, level)
+
+        started = time.perf_counter()
+        response = await self.client.generate_async(prompt)
+        self.latency["llm"].record(time.perf_counter() - started)
         if not response:
             # Fallback question if API call fails
-            return f"Explain the concept of {topic} at a {difficulty.lower()} level. What are the key aspects a {level} should know?"
-        
-        return response
\ No newline at end of file
+            self.counters["fallback"] += 1
+            return self.fallback_question(topic, difficulty, level)
+
+        self.counters["llm"] += 1
+        return response
+
+    async def stream_question(self, topic, difficulty, level, history):
+        """Async generator over chunks of the next question; falls back like get_question."""
+        if self.retrieval_first:
+            question = await asyncio.to_thread(self.pick_bank_question, topic, difficulty, history)
+            if question:
+                self.counters["bank_hits"] += 1
+                yield question
+                return
+            self.counters["bank_misses"] += 1
+
+        if self.pool and self.is_opening(history):
+            question = await self.pool.take(topic, difficulty, level)
+            if question:
+                self.counters["pool_hits"] += 1
+                yield question
+                return
+
+        if self.client and self.client.available:
+            streamed = False
+            async for chunk in self.client.stream_async(self.build_prompt(topic, difficulty, level, history)):
+                streamed = True
+                yield chunk
+            if streamed:
+                self.counters["llm"] += 1
+                return
+        self.counters["fallback"] += 1
+        yield self.fallback_question(topic, difficulty, level)
+
+    def stats(self):
+        lookups = self.counters["bank_hits"] + self.counters["bank_misses"]
+        return {
+            "retrieval_first": self.retrieval_first,
+            **self.counters,
+            "bank_hit_ratio": round(self.counters["bank_hits"] / lookups, 3) if lookups else 0.0,
+            "avg_prompt_tokens": round(self.prompt_tokens["tokens"] / self.prompt_tokens["prompts"], 1) if self.prompt_tokens["prompts"] else 0.0,
+            "latency": {path: window.stats() for path, window in self.latency.items()},
+            "embeddings": self._vector_store.embedder.stats() if self._vector_store else None,
+            "pool": self.pool.stats() if self.pool else None,
+        }
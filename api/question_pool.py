@@ -0,0 +1,172 @@
+import os
+import math
+import time
+import asyncio
+
+from api.database import pop_pool_question, add_pool_questions, pool_depths
+from api.gemini_client import rpm_headroom
+
+# Pre-generated opening questions per (topic, difficulty, level), so a fresh combination does not wait on Gemini.
+# Opt-in: the refill worker spends Gemini quota on speculative batches. Set QUESTION_POOL_ENABLED=1 to turn it on.
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "0") == "1"
+# A key is refilled up to POOL_TARGET_DEPTH once it drops below POOL_LOW_WATER
+POOL_LOW_WATER = int(os.getenv("POOL_LOW_WATER", "3"))
+POOL_TARGET_DEPTH = int(os.getenv("POOL_TARGET_DEPTH", "10"))
+# Questions requested per LLM call
+POOL_BATCH_SIZE = int(os.getenv("POOL_BATCH_SIZE", "5"))
+POOL_REFILL_CONCURRENCY = int(os.getenv("POOL_REFILL_CONCURRENCY", "2"))
+# LLM calls one refill pass may spend, hottest keys first
+POOL_CALLS_PER_PASS = int(os.getenv("POOL_CALLS_PER_PASS", "8"))
+POOL_REFILL_INTERVAL = float(os.getenv("POOL_REFILL_INTERVAL", "30"))
+# Refill only spends RPM slots above this floor; the rest stays free for live questions and evaluations
+POOL_MIN_RPM_HEADROOM = float(os.getenv("POOL_MIN_RPM_HEADROOM", "5"))
+# Only the most-demanded keys are kept warm
+POOL_MAX_KEYS = int(os.getenv("POOL_MAX_KEYS", "30"))
+POOL_DEMAND_HALF_LIFE = float(os.getenv("POOL_DEMAND_HALF_LIFE", "3600"))
+# Pooled questions are history-free, so only an interview's opening question
+# (always Easy) is served from the pool; follow-ups use the contextual prompt
+OPENING_DIFFICULTY = "Easy"
+
+
+class QuestionPool:
+    """
+    Database-backed pool of ready questions, popped atomically by any worker.
+
+    Demand is tracked per key with exponential decay: /start_interview records
+    the interview's opening key, and every pop records its exact key. A
+    background task tops up the most-demanded keys that fell below the
+    low-water mark, several questions per LLM call, and backs off whenever the
+    shared Gemini RPM budget is down to POOL_MIN_RPM_HEADROOM.
+    """
+
+    def __init__(self, q_engine):
+        self.q_engine = q_engine
+        self._demand = {}  # key -> (weight, updated_at)
+        self._depths = {}  # last known depth per key
+        self._wake = None
+        self._worker = None
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "refill_calls": 0,
+            "refill_failures": 0,
+            "questions_added": 0,
+            "deferred_calls": 0,
+        }
+
+    def _bump(self, key, amount):
+        now = time.time()
+        weight, updated = self._demand.get(key, (0.0, now))
+        self._demand[key] = (weight * 0.5 ** ((now - updated) / POOL_DEMAND_HALF_LIFE) + amount, now)
+
+    def demand(self, key):
+        weight, updated = self._demand.get(key, (0.0, time.time()))
+        return weight * 0.5 ** ((time.time() - updated) / POOL_DEMAND_HALF_LIFE)
+
+    def hot_keys(self):
+        """The POOL_MAX_KEYS most-demanded keys, hottest first."""
+        return sorted(self._demand, key=self.demand, reverse=True)[:POOL_MAX_KEYS]
+
+    def record_interview(self, topic, level):
+        key = (topic, OPENING_DIFFICULTY, level)
+        self._bump(key, 1.0)
+        self._ensure_worker()
+        # The first question is asked right away: make sure its key gets filled now
+        if self._depths.get(key, 0) < POOL_LOW_WATER:
+            self._wake.set()
+
+    async def take(self, topic, difficulty, level):
+        """
+        A pooled question for the key, or None if the pool is empty. Only asked
+        for an interview's opening question, so there is nothing to skip.
+        """
+        key = (topic, difficulty, level)
+        self._bump(key, 1.0)
+        self._ensure_worker()
+        question = await asyncio.to_thread(pop_pool_question, topic, difficulty, level)
+
+        depth = max(self._depths.get(key, 0) - 1, 0)
+        self._depths[key] = depth
+        if question is None:
+            self.counters["misses"] += 1
+        else:
+            self.counters["hits"] += 1
+        if depth < POOL_LOW_WATER:
+            self._wake.set()
+        return question
+
+    def _ensure_worker(self):
+        # Started lazily from a request, so it runs on the server's event loop
+        if self._worker is None or self._worker.done():
+            self._wake = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POOL_REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Question pool refill failed: {e}")
+
+    async def refill(self):
+        """One pass: tops up hot keys below the low-water mark within POOL_CALLS_PER_PASS calls."""
+        self._depths = await asyncio.to_thread(pool_depths)
+        budget = POOL_CALLS_PER_PASS
+        jobs = []
+        for key in self.hot_keys():
+            depth = self._depths.get(key, 0)
+            if depth >= POOL_LOW_WATER:
+                continue
+            calls = min(math.ceil((POOL_TARGET_DEPTH - depth) / POOL_BATCH_SIZE), budget)
+            jobs.extend([key] * calls)
+            budget -= calls
+            if budget <= 0:
+                break
+        if not jobs:
+            return
+
+        semaphore = asyncio.Semaphore(POOL_REFILL_CONCURRENCY)
+        backed_off = False
+
+        async def fill(key):
+            nonlocal backed_off
+            async with semaphore:
+                # Back off for the rest of the pass once the budget is down to the floor
+                if backed_off or await asyncio.to_thread(rpm_headroom) < POOL_MIN_RPM_HEADROOM:
+                    backed_off = True
+                    self.counters["deferred_calls"] += 1
+                    return
+                self.counters["refill_calls"] += 1
+                questions = await self.q_engine.generate_batch(*key, POOL_BATCH_SIZE)
+                if not questions:
+                    self.counters["refill_failures"] += 1
+                    return
+                added = await asyncio.to_thread(add_pool_questions, *key, questions)
+                self._depths[key] = self._depths.get(key, 0) + added
+                self.counters["questions_added"] += added
+
+        await asyncio.gather(*(fill(key) for key in jobs))
+
+    def stats(self):
+        stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["empty_pool_miss_rate"] = round(stats["misses"] / lookups, 3) if lookups else 0.0
+        stats["depth_total"] = sum(self._depths.values())
+        stats["depth"] = {" / ".join(key): self._depths.get(key, 0) for key in self.hot_keys()}
+        stats["worker_running"] = self._worker is not None and not self._worker.done()
+        return stats
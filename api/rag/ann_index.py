@@ -0,0 +1,252 @@
+import hashlib
+import faiss
+import numpy as np
+
+# Corpus-size bands for picking the index structure
+FLAT_MAX_VECTORS = 20_000
+HNSW_MAX_VECTORS = 200_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+# k-means wants ~40 training points per list; more only slows training down
+IVF_TRAIN_PER_LIST = 40
+
+
+def question_id_to_int(question_id):
+    """FAISS ids are int64: numeric bank ids are kept, anything else gets a stable 63-bit hash."""
+    try:
+        return int(question_id)
+    except (TypeError, ValueError):
+        digest = hashlib.blake2b(str(question_id).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def choose_index_kind(n):
+    if n < FLAT_MAX_VECTORS:
+        return "flat"
+    if n < HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def normalize(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def difficulty_labels(item):
+    # Bank entries like "Medium/Hard" count for both levels
+    return [d.strip() for d in str(item.get("difficulty", "")).lower().split("/") if d.strip()]
+
+
+def topic_matches(item_topic, topic):
+    # Session topics are broad ("SQL"), bank topics specific ("SQL Aggregation & Filtering")
+    return topic in item_topic or item_topic in topic
+
+
+def create_index(dimension, n, kind=None):
+    """Empty cosine-similarity (normalized inner product) index wrapped in an IDMap."""
+    kind = kind or choose_index_kind(n)
+    if kind == "flat":
+        base = faiss.IndexFlatIP(dimension)
+    elif kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind == "ivf":
+        nlist = max(1, int(4 * np.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(dimension)
+        base = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        base.nprobe = IVF_NPROBE
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    return faiss.IndexIDMap2(base)
+
+
+def training_size(index):
+    """Vectors to buffer before the first add: enough to train an untrained IVF, else 0."""
+    base = faiss.downcast_index(index.index)
+    if isinstance(base, faiss.IndexIVF) and not base.is_trained:
+        return base.nlist * IVF_TRAIN_PER_LIST
+    return 0
+
+
+def index_kind(index):
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+class IndexBuilder:
+    """
+    Fills a fresh index for n vectors chunk by chunk, so a rebuild never holds
+    every embedding at once. An IVF index buffers only its training sample.
+    """
+
+    def __init__(self, n, kind=None):
+        self.n = n
+        self.kind = kind
+        self.index = None
+        self._needed = 0
+        self._pending = []
+        self._buffered = 0
+
+    def add(self, vectors, ids):
+        vectors = normalize(vectors)
+        if self.index is None:
+            self.index = create_index(vectors.shape[1], self.n, self.kind)
+            self._needed = training_size(self.index)
+        self._pending.append((vectors, np.asarray(ids, dtype="int64")))
+        self._buffered += len(vectors)
+        if self._buffered >= self._needed:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        vectors = np.vstack([v for v, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending, self._buffered = [], 0
+        if self._needed:
+            faiss.downcast_index(self.index.index).train(vectors)
+            self._needed = 0
+        self.index.add_with_ids(vectors, ids)
+
+    def finish(self):
+        self._flush()
+        if self.index is None:
+            raise ValueError("No questions to index")
+        return self.index
+
+
+class AnnIndex:
+    """
+    FAISS index plus per-difficulty and per-topic inverted id lists, so filtered
+    searches hand FAISS an id selector instead of post-filtering results.
+
+    Also reads the legacy layout (bare IndexFlatL2, ids = list positions).
+    """
+
+    def __init__(self, index, items):
+        self.index = index
+        self.items = items  # faiss id -> question dict, or a ColumnarMetadata view
+        self.legacy = not isinstance(index, faiss.IndexIDMap)
+        self.kind = index_kind(index)
+        self._build_inverted_lists()
+
+    @classmethod
+    def build(cls, embeddings, items, kind=None):
+        vectors = normalize(embeddings)
+        ids = np.array([question_id_to_int(item["id"]) for item in items], dtype="int64")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Question ids must be unique")
+        index = create_index(vectors.shape[1], len(items), kind)
+        base = faiss.downcast_index(index.index)
+        if isinstance(base, faiss.IndexIVF) and not base.is_trained:
+            base.train(vectors)
+        index.add_with_ids(vectors, ids)
+        return cls(index, dict(zip(ids.tolist(), items)))
+
+    @classmethod
+    def from_metadata(cls, index, metadata):
+        """Pairs a loaded FAISS index with the metadata saved next to it (pickled list or ColumnarMetadata)."""
+        if hasattr(metadata, "inverted_lists"):
+            return cls(index, metadata)
+        if isinstance(index, faiss.IndexIDMap):
+            items = {question_id_to_int(item["id"]): item for item in metadata}
+        else:
+            items = dict(enumerate(metadata))
+        return cls(index, items)
+
+    def _build_inverted_lists(self):
+        if hasattr(self.items, "inverted_lists"):
+            self.difficulty_ids, self.topic_ids = self.items.inverted_lists()
+            return
+        difficulty, topic = {}, {}
+        for vid, item in self.items.items():
+            for label in difficulty_labels(item):
+                difficulty.setdefault(label, []).append(vid)
+            topic.setdefault(str(item.get("topic", "")).lower(), []).append(vid)
+        self.difficulty_ids = {k: np.array(sorted(v), dtype="int64") for k, v in difficulty.items()}
+        self.topic_ids = {k: np.array(sorted(v), dtype="int64") for k, v in topic.items()}
+        self.question_ids = {item.get("question"): vid for vid, item in self.items.items()}
+
+    def ids_for(self, difficulty=None, topic=None):
+        """Allowed ids for the filters, or None when unfiltered."""
+        allowed = None
+        if difficulty:
+            allowed = self.difficulty_ids.get(difficulty.lower(), np.empty(0, dtype="int64"))
+        if topic:
+            topic = topic.lower()
+            lists = [ids for t, ids in self.topic_ids.items() if topic_matches(t, topic)]
+            topic_ids = np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype="int64")
+            allowed = topic_ids if allowed is None else np.intersect1d(allowed, topic_ids, assume_unique=True)
+        return allowed
+
+    def ids_for_questions(self, texts):
+        """Ids of the given question texts (e.g. ones already asked in a session)."""
+        if hasattr(self.items, "ids_for_questions"):
+            return set(self.items.ids_for_questions(list(texts)).tolist())
+        return {self.question_ids[t] for t in texts if t in self.question_ids}
+
+    def _similarity(self, scores):
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return scores
+        # Unit vectors: squared L2 = 2 - 2 cos
+        return 1.0 - scores / 2.0
+
+    def _search_params(self, selector):
+        if self.kind == "hnsw":
+            # Filtering prunes graph neighbours, so widen the beam
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH * 2)
+        if self.kind == "ivf":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=IVF_NPROBE)
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, query_vectors, k=5, difficulty=None, topic=None, exclude_ids=None):
+        """
+        Returns a list (one per query) of [(similarity, id, item)], best first.
+        Filters and exclusions are pushed into FAISS as an IDSelector.
+        """
+        # Copy: normalize works in place and query vectors may be cached, read-only arrays
+        queries = normalize(np.array(query_vectors, dtype="float32", ndmin=2))
+        if self.index.ntotal == 0:
+            return [[] for _ in range(len(queries))]
+
+        allowed = self.ids_for(difficulty, topic)
+        excluded = np.array(sorted(exclude_ids), dtype="int64") if exclude_ids else None
+        if allowed is not None and excluded is not None:
+            allowed = np.setdiff1d(allowed, excluded, assume_unique=True)
+            excluded = None
+        if allowed is not None and len(allowed) == 0:
+            return [[] for _ in range(len(queries))]
+
+        # Keep the selector objects referenced for the duration of the call (SWIG does not own them)
+        selectors = []
+        if allowed is not None:
+            selectors.append(faiss.IDSelectorBatch(allowed))
+        elif excluded is not None:
+            selectors.append(faiss.IDSelectorBatch(excluded))
+            selectors.append(faiss.IDSelectorNot(selectors[0]))
+
+        k = min(k, self.index.ntotal)
+        if selectors:
+            scores, ids = self.index.search(queries, k, params=self._search_params(selectors[-1]))
+        else:
+            scores, ids = self.index.search(queries, k)
+        scores = self._similarity(scores)
+
+        results = []
+        for row_scores, row_ids in zip(scores, ids):
+            row = []
+            for score, vid in zip(row_scores, row_ids):
+                if vid < 0 or vid not in self.items:
+                    continue
+                row.append((float(score), int(vid), self.items[vid]))
+            results.append(row)
+        return results
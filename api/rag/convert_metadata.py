@@ -0,0 +1,28 @@
+import os
+import pickle
+import sys
+import faiss
+
+try:
+    from api.rag.ingest import COLUMNS_PATH, INDEX_PATH, META_PATH, write_columns
+except ImportError:
+    # Run as a script from api/ (python rag/convert_metadata.py)
+    from ingest import COLUMNS_PATH, INDEX_PATH, META_PATH, write_columns
+
+
+def convert(index_path=INDEX_PATH, meta_path=META_PATH, columns_path=COLUMNS_PATH):
+    """Writes metadata.cols from metadata.pkl so VectorStore can mmap it instead of unpickling."""
+    print("📂 Loading pickled metadata...")
+    with open(meta_path, "rb") as f:
+        data = pickle.load(f)
+
+    ids = None
+    if os.path.exists(index_path) and not isinstance(faiss.read_index(index_path), faiss.IndexIDMap):
+        # Legacy index: FAISS ids are list positions, not question ids
+        ids = list(range(len(data)))
+
+    write_columns(columns_path, data, ids)
+    print(f"✅ Wrote {len(data)} items to {columns_path} ({os.path.getsize(columns_path)} bytes)")
+
+if __name__ == "__main__":
+    convert(*sys.argv[1:4])
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+HF_REPO = f"sentence-transformers/{MODEL_NAME}"
+# "sentence-transformers" (PyTorch) or "onnx" (onnxruntime + tokenizers, no torch import)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+# int8-quantized export shipped in the model repo; "onnx/model.onnx" for fp32
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+# Local directory holding the ONNX file and tokenizer.json, instead of the Hugging Face hub
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR")
+EMBEDDING_QUERY_CACHE = int(os.getenv("EMBEDDING_QUERY_CACHE", "1024"))
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_LENGTH = 256  # all-MiniLM-L6-v2's max_seq_length
+
+
+def l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class SentenceTransformerBackend:
+    name = "sentence-transformers"
+
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(MODEL_NAME)
+
+    def encode(self, texts):
+        embeddings = self.model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True)
+        return np.asarray(embeddings, dtype="float32")
+
+
+class OnnxBackend:
+    """
+    The same model run through onnxruntime. Mean pooling + L2 norm mirror the
+    sentence-transformers pipeline, so vectors land in the same space as the index.
+    """
+    name = "onnx"
+
+    def __init__(self, model_file=EMBEDDING_ONNX_FILE, model_dir=EMBEDDING_ONNX_DIR):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if model_dir:
+            model_path = os.path.join(model_dir, model_file)
+            tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        else:
+            from huggingface_hub import hf_hub_download
+            model_path = hf_hub_download(HF_REPO, model_file)
+            tokenizer_path = hf_hub_download(HF_REPO, "tokenizer.json")
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(EMBEDDING_MAX_LENGTH)
+        self.tokenizer.enable_padding()
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts):
+        batches = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            encoded = self.tokenizer.encode_batch(texts[start:start + EMBEDDING_BATCH_SIZE])
+            input_ids = np.array([e.ids for e in encoded], dtype="int64")
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype="int64")
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feeds)[0]
+
+            mask = attention_mask[..., None].astype("float32")
+            batches.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        return l2_normalize(np.vstack(batches))
+
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+class Embedder:
+    """
+    Loads its backend on first use and keeps a small LRU of query embeddings,
+    since sessions on the same topic send the same query strings again and again.
+    """
+
+    def __init__(self, backend=EMBEDDING_BACKEND, cache_size=EMBEDDING_QUERY_CACHE):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.backend_name = backend
+        self.cache_size = cache_size
+        self._backend = None
+        self._load_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.load_seconds = None
+        self.counters = {"cache_hits": 0, "cache_misses": 0, "encoded": 0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._load_lock:
+                if self._backend is None:
+                    started = time.perf_counter()
+                    self._backend = BACKENDS[self.backend_name]()
+                    self.load_seconds = time.perf_counter() - started
+                    print(f"✅ Embedding backend '{self.backend_name}' loaded in {self.load_seconds:.2f}s")
+        return self._backend
+
+    def encode(self, texts):
+        """Normalized float32 embeddings, one row per text (no caching)."""
+        self.counters["encoded"] += len(texts)
+        return self.backend.encode(list(texts))
+
+    def encode_query(self, text):
+        with self._cache_lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.counters["cache_hits"] += 1
+                return vector
+            self.counters["cache_misses"] += 1
+
+        vector = self.encode([text])[0]
+        vector.setflags(write=False)  # shared between callers
+        if self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[text] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return vector
+
+    def warm_up(self):
+        """Loads the backend and runs one encode so the first real query does not pay for either."""
+        self.encode(["warm up"])
+        return self.load_seconds
+
+    def stats(self):
+        with self._cache_lock:
+            cached = len(self._cache)
+        return {
+            "backend": self.backend_name,
+            "loaded": self._backend is not None,
+            "load_s": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "cached_queries": cached,
+            **self.counters,
+        }
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """One Embedder (and so one loaded model) per process."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = Embedder()
+    return _embedder
@@ -1,30 +1,318 @@
+import hashlib
 import json
-import faiss
+import os
 import pickle
+import sqlite3
+import sys
+import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-
-def ingest_data():
-    print("🔄 Loading Embedding Model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    print("📂 Loading Questions...")
-    with open("data/questions.json", "r") as f:
-        data = json.load(f)
-    
-    texts = [item['question'] + " " + item['topic'] for item in data]
-    embeddings = model.encode(texts)
-    
-    print(f"⚙️ Creating Index for {len(data)} items...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(embeddings).astype('float32'))
-    
-    faiss.write_index(index, "rag/index.faiss")
-    with open("rag/metadata.pkl", "wb") as f:
-        pickle.dump(data, f)
-        
-    print("✅ Ingestion Complete. Vector DB Ready.")
+
+try:
+    from api.rag.ann_index import IndexBuilder, choose_index_kind, index_kind, normalize, question_id_to_int
+    from api.rag.metadata_store import ColumnarWriter, write_columnar
+except ImportError:
+    # Run as a script from api/ (python rag/ingest.py)
+    from ann_index import IndexBuilder, choose_index_kind, index_kind, normalize, question_id_to_int
+    from metadata_store import ColumnarWriter, write_columnar
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(RAG_DIR, "..", "data", "questions.json")
+# Appendable .jsonl shards written by add_questions.py, read after DATA_PATH
+SHARDS_DIR = os.path.join(RAG_DIR, "..", "data", "shards")
+INDEX_PATH = os.path.join(RAG_DIR, "index.faiss")
+META_PATH = os.path.join(RAG_DIR, "metadata.pkl")
+COLUMNS_PATH = os.path.join(RAG_DIR, "metadata.cols")
+CACHE_PATH = os.path.join(RAG_DIR, "embedding_cache.db")
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "2048"))
+# A rebuild encodes and indexes this many questions at a time (~30 MB of vectors at the default)
+INGEST_REBUILD_CHUNK_SIZE = int(os.getenv("INGEST_REBUILD_CHUNK_SIZE", "20000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Multi-process encoding only pays for its worker start-up on large batches
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_MULTIPROCESS_MIN = int(os.getenv("INGEST_MULTIPROCESS_MIN", "5000"))
+# Protocol 2 pickles carry no frames, so items can be concatenated into one list stream
+PICKLE_PROTOCOL = 2
+
+
+def embedding_text(item):
+    return item['question'] + " " + item['topic']
+
+
+def content_hash(item):
+    # The model name is part of the key so switching models invalidates the cache
+    return hashlib.sha256(f"{MODEL_NAME}\0{embedding_text(item)}".encode("utf-8")).hexdigest()
+
+
+def iter_questions(path):
+    """Yields question dicts from a JSON array or, streamed line by line, from a .jsonl file."""
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def shard_paths(shards_dir=SHARDS_DIR):
+    if not os.path.isdir(shards_dir):
+        return []
+    return sorted(os.path.join(shards_dir, name) for name in os.listdir(shards_dir) if name.endswith(".jsonl"))
+
+
+def iter_bank(data_path=DATA_PATH, shards_dir=SHARDS_DIR):
+    """The whole question bank: the base file, then every shard in name (= creation) order."""
+    if os.path.exists(data_path):
+        yield from iter_questions(data_path)
+    for path in shard_paths(shards_dir):
+        yield from iter_questions(path)
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def atomic_write(path, write):
+    """write(tmp_path) then rename over path, so readers see the old file or the new one, never half of it."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        write(tmp_path)
+        replace_atomic(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def replace_atomic(tmp_path, path):
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_pickle(path, data):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+    atomic_write(path, write)
+
+
+def write_columns(path, data, ids=None):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            write_columnar(f, data, ids)
+    atomic_write(path, write)
+
+
+class MetadataWriter:
+    """
+    Writes metadata.pkl and metadata.cols a chunk at a time into temp files and
+    renames both into place on commit(), so the bank is never held as one list.
+    """
+
+    def __init__(self, meta_path, columns_path):
+        self.paths = [(path, f"{path}.tmp-{os.getpid()}") for path in (meta_path, columns_path)]
+        self.pickle = open(self.paths[0][1], "wb")
+        self.pickle.write(pickle.PROTO + bytes([PICKLE_PROTOCOL]) + pickle.EMPTY_LIST)
+        self.columns = ColumnarWriter()
+
+    def add(self, items, ids=None):
+        # Same opcodes pickle.dump emits for a list: MARK, the items, APPENDS. Each item
+        # is pickled on its own minus PROTO and STOP; its memo entries only refer to itself.
+        self.pickle.write(pickle.MARK)
+        for item in items:
+            self.pickle.write(pickle.dumps(item, PICKLE_PROTOCOL)[2:-1])
+        self.pickle.write(pickle.APPENDS)
+        self.columns.add(items, ids)
+
+    def commit(self):
+        self.pickle.write(pickle.STOP)
+        self.pickle.close()
+        with open(self.paths[1][1], "wb") as f:
+            self.columns.finish(f)
+        for path, tmp_path in self.paths:
+            replace_atomic(tmp_path, path)
+
+    def close(self):
+        self.pickle.close()
+        self.columns.close()
+        for _, tmp_path in self.paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class EmbeddingCache:
+    """
+    Content hash -> embedding, plus the (id, hash) manifest of what the index on
+    disk currently holds. Both live in one SQLite file next to the index.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS manifest (vid INTEGER PRIMARY KEY, hash TEXT)")
+        self.conn.commit()
+
+    def get_many(self, hashes):
+        found = {}
+        unique = list(set(hashes))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update((h, np.frombuffer(v, dtype="float32")) for h, v in rows)
+        return found
+
+    def put_many(self, hashes, vectors):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+            [(h, np.asarray(v, dtype="float32").tobytes()) for h, v in zip(hashes, vectors)],
+        )
+        self.conn.commit()
+
+    def manifest(self):
+        return dict(self.conn.execute("SELECT vid, hash FROM manifest").fetchall())
+
+    def save_manifest(self, current):
+        self.conn.execute("DELETE FROM manifest")
+        self.conn.executemany("INSERT INTO manifest (vid, hash) VALUES (?, ?)", current.items())
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class Encoder:
+    """Loads the model only when something actually needs encoding."""
+
+    def __init__(self):
+        self.model = None
+        self.pool = None
+
+    def encode(self, texts):
+        if self.model is None:
+            print("🔄 Loading Embedding Model...")
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(MODEL_NAME)
+
+        if INGEST_WORKERS > 1 and len(texts) >= INGEST_MULTIPROCESS_MIN:
+            if self.pool is None:
+                self.pool = self.model.start_multi_process_pool(["cpu"] * INGEST_WORKERS)
+            embeddings = self.model.encode_multi_process(texts, self.pool, batch_size=INGEST_BATCH_SIZE)
+            return normalize(embeddings)
+        embeddings = self.model.encode(texts, batch_size=INGEST_BATCH_SIZE, normalize_embeddings=True)
+        return np.asarray(embeddings, dtype="float32")
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+def embed(items, hashes, cache, encoder):
+    """Embeddings for items, in order; only cache misses go through the model."""
+    cached = cache.get_many(hashes)
+    missing = [i for i, h in enumerate(hashes) if h not in cached]
+    if missing:
+        vectors = encoder.encode([embedding_text(items[i]) for i in missing])
+        cache.put_many([hashes[i] for i in missing], vectors)
+        cached.update(zip((hashes[i] for i in missing), vectors))
+    return np.vstack([cached[h] for h in hashes]).astype("float32") if hashes else None
+
+
+def load_existing_index(index_path):
+    if not os.path.exists(index_path):
+        return None
+    index = faiss.read_index(index_path)
+    # The legacy layout (bare IndexFlatL2, positional ids) cannot be updated by id
+    return index if isinstance(index, faiss.IndexIDMap) else None
+
+
+def ingest_data(data_path=DATA_PATH, index_path=INDEX_PATH, meta_path=META_PATH, cache_path=CACHE_PATH, full=False,
+                columns_path=COLUMNS_PATH, shards_dir=SHARDS_DIR):
+    """
+    Brings the index in line with the questions file and its shards. Unchanged questions (same
+    content hash) are neither re-encoded nor re-added; changed and new ones are
+    upserted by id and deleted ones removed.
+    """
+    cache = EmbeddingCache(cache_path)
+    encoder = Encoder()
+    try:
+        index = None if full else load_existing_index(index_path)
+        previous = cache.manifest() if index is not None else {}
+        if index is not None and len(previous) != index.ntotal:
+            # Manifest lost or out of sync with the index on disk
+            index, previous = None, {}
+
+        print("📂 Loading Questions...")
+        current, count = {}, 0
+        changed_ids, changed_vectors = [], []
+        for chunk in chunked(iter_bank(data_path, shards_dir), INGEST_CHUNK_SIZE):
+            hashes = [content_hash(item) for item in chunk]
+            ids = [question_id_to_int(item['id']) for item in chunk]
+            pending = [i for i, (vid, h) in enumerate(zip(ids, hashes)) if previous.get(vid) != h]
+            if index is not None and pending:
+                changed_ids.extend(ids[i] for i in pending)
+                changed_vectors.append(embed([chunk[i] for i in pending], [hashes[i] for i in pending], cache, encoder))
+            count += len(chunk)
+            current.update(zip(ids, hashes))
+
+        if len(current) != count:
+            raise ValueError("Question ids must be unique")
+
+        removed = [vid for vid in previous if vid not in current]
+        replaced = [vid for vid in changed_ids if vid in previous]
+        rebuild = (
+            index is None
+            or index_kind(index) != choose_index_kind(count)
+            # HNSW graphs do not support deletion
+            or (index_kind(index) == "hnsw" and (removed or replaced))
+        )
+
+        if rebuild:
+            print(f"⚙️ Creating Index for {count} items...")
+        elif changed_ids or removed:
+            print(f"⚙️ Updating Index: {len(changed_ids) - len(replaced)} added, {len(replaced)} changed, {len(removed)} removed")
+            if removed or replaced:
+                index.remove_ids(np.array(removed + replaced, dtype="int64"))
+            if changed_ids:
+                index.add_with_ids(np.vstack(changed_vectors), np.array(changed_ids, dtype="int64"))
+        else:
+            print("✅ Index already up to date.")
+            return
+
+        # Second pass over the bank: metadata is streamed to disk and, on a rebuild, the
+        # index is filled chunk by chunk (cache hits from the first pass skip the model)
+        builder = IndexBuilder(count) if rebuild else None
+        metadata = MetadataWriter(meta_path, columns_path)
+        try:
+            for chunk in chunked(iter_bank(data_path, shards_dir), INGEST_REBUILD_CHUNK_SIZE if rebuild else INGEST_CHUNK_SIZE):
+                ids = [question_id_to_int(item['id']) for item in chunk]
+                metadata.add(chunk, ids)
+                if builder:
+                    builder.add(embed(chunk, [content_hash(item) for item in chunk], cache, encoder), ids)
+            if builder:
+                index = builder.finish()
+            # Metadata first: ids the other file does not know about are skipped at search time,
+            # so a reader that catches one old and one new file still gets valid results
+            metadata.commit()
+        finally:
+            metadata.close()
+        atomic_write(index_path, lambda tmp_path: faiss.write_index(index, tmp_path))
+        cache.save_manifest(current)
+        print(f"✅ Ingestion Complete. Vector DB Ready ({index_kind(index)}, {index.ntotal} vectors).")
+    finally:
+        encoder.close()
+        cache.close()
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    ingest_data(full="--full" in sys.argv)
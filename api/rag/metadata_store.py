@@ -0,0 +1,210 @@
+import hashlib
+import json
+import mmap
+import struct
+import tempfile
+import faiss
+import numpy as np
+
+try:
+    from api.rag.ann_index import difficulty_labels, question_id_to_int
+except ImportError:
+    # Imported from the ingest script (python rag/ingest.py)
+    from ann_index import difficulty_labels, question_id_to_int
+
+# File layout: MAGIC, u64 header length, JSON header, then 64-byte aligned arrays
+MAGIC = b"QBCOLS1\n"
+ALIGN = 64
+# Real mmap of flat/HNSW vector storage; older FAISS only maps IVF lists
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def question_hash(text):
+    digest = hashlib.blake2b(str(text).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def read_index_mmap(path):
+    """Opens a FAISS index without copying its vectors into private memory, if this FAISS build can."""
+    try:
+        return faiss.read_index(path, MMAP_FLAGS)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def write_columnar(f, items, ids=None):
+    """
+    Writes question dicts as columns sorted by FAISS id: interned topic and
+    difficulty codes, question-text hashes, and each item's JSON in one blob
+    addressed by an offsets array.
+    """
+    writer = ColumnarWriter()
+    try:
+        writer.add(items, ids)
+        writer.finish(f)
+    finally:
+        writer.close()
+
+
+class ColumnarWriter:
+    """
+    write_columnar for items that arrive in chunks. Each item's JSON is spooled
+    to a temporary file as it comes in; only the fixed-size columns stay in
+    memory until finish() sorts them by id and copies the blobs across in order.
+    """
+
+    def __init__(self):
+        self._spool = tempfile.TemporaryFile()
+        self._topics, self._difficulties = {}, {}
+        self._columns = {"ids": [], "topic_codes": [], "difficulty_codes": [], "question_hashes": [], "lengths": []}
+        self.count = 0
+
+    def add(self, items, ids=None):
+        if ids is None:
+            ids = [question_id_to_int(item["id"]) for item in items]
+        topic_codes = np.empty(len(items), dtype="uint32")
+        difficulty_codes = np.empty(len(items), dtype="uint32")
+        question_hashes = np.empty(len(items), dtype="int64")
+        lengths = np.empty(len(items), dtype="int64")
+        for row, item in enumerate(items):
+            topic_codes[row] = self._topics.setdefault(str(item.get("topic", "")), len(self._topics))
+            difficulty_codes[row] = self._difficulties.setdefault(str(item.get("difficulty", "")), len(self._difficulties))
+            question_hashes[row] = question_hash(item.get("question"))
+            blob = json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._spool.write(blob)
+            lengths[row] = len(blob)
+        for name, array in (("ids", np.asarray(ids, dtype="int64")), ("topic_codes", topic_codes),
+                            ("difficulty_codes", difficulty_codes), ("question_hashes", question_hashes),
+                            ("lengths", lengths)):
+            self._columns[name].append(array)
+        self.count += len(items)
+
+    def finish(self, f):
+        columns = {name: np.concatenate(arrays) if arrays else np.empty(0, dtype="int64")
+                   for name, arrays in self._columns.items()}
+        order = np.argsort(columns["ids"], kind="stable")
+        lengths = columns["lengths"]
+        starts = np.cumsum(lengths) - lengths  # spool position of each item, in arrival order
+        offsets = np.zeros(self.count + 1, dtype="int64")
+        np.cumsum(lengths[order], out=offsets[1:])
+
+        arrays = {
+            "ids": columns["ids"][order],
+            "topic_codes": columns["topic_codes"][order].astype("uint32"),
+            "difficulty_codes": columns["difficulty_codes"][order].astype("uint32"),
+            "question_hashes": columns["question_hashes"][order],
+            "offsets": offsets,
+        }
+        header = {"count": self.count, "topics": list(self._topics), "difficulties": list(self._difficulties), "arrays": {}}
+
+        # Offsets are relative to the end of the header, so they can be laid out before its size is known
+        position = 0
+        for name, array in arrays.items():
+            position = _align(position)
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+            position += array.nbytes
+        position = _align(position)
+        header["arrays"]["blob"] = {"dtype": "|u1", "shape": [int(offsets[-1])], "offset": position}
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.seek(data_start + header["arrays"]["blob"]["offset"])
+        if offsets[-1]:
+            self._spool.flush()
+            with mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ) as spool:
+                for pos in order:
+                    f.write(spool[starts[pos]:starts[pos] + lengths[pos]])
+
+    def close(self):
+        self._spool.close()
+
+
+class ColumnarMetadata:
+    """
+    Read-only, mmapped view of a file written by write_columnar. Behaves like the
+    {faiss id: question dict} mapping AnnIndex expects, but items are only decoded
+    when a search actually returns them; the pages are shared between processes
+    through the OS cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a columnar metadata file: {path}")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len))
+        data_start = _align(len(MAGIC) + 8 + header_len)
+
+        self.topics = header["topics"]
+        self.difficulties = header["difficulties"]
+        self.count = header["count"]
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if shape[0] == 0:
+                array = np.empty(shape, dtype=spec["dtype"])
+            else:
+                array = np.memmap(path, dtype=spec["dtype"], mode="r", offset=data_start + spec["offset"], shape=shape)
+            setattr(self, name, array)
+
+    def _row(self, vid):
+        row = int(np.searchsorted(self.ids, vid))
+        if row < self.count and self.ids[row] == vid:
+            return row
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, vid):
+        return self._row(vid) is not None
+
+    def __getitem__(self, vid):
+        row = self._row(vid)
+        if row is None:
+            raise KeyError(vid)
+        return self.item_at(row)
+
+    def get(self, vid, default=None):
+        row = self._row(vid)
+        return default if row is None else self.item_at(row)
+
+    def item_at(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self.blob[start:end].tobytes())
+
+    def __iter__(self):
+        # Iterates question dicts in id order, like iterating the pickled list
+        for row in range(self.count):
+            yield self.item_at(row)
+
+    def _group_ids(self, codes, size):
+        # One stable sort instead of a full scan per code
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=size)
+        return np.split(self.ids[order], np.cumsum(counts)[:-1])
+
+    def inverted_lists(self):
+        """({difficulty label: ids}, {lowercase topic: ids}) from the code columns, without decoding items."""
+        difficulty_ids, topic_ids = {}, {}
+        for raw, ids in zip(self.difficulties, self._group_ids(self.difficulty_codes, len(self.difficulties))):
+            for label in difficulty_labels({"difficulty": raw}):
+                difficulty_ids.setdefault(label, []).append(ids)
+        for raw, ids in zip(self.topics, self._group_ids(self.topic_codes, len(self.topics))):
+            topic_ids.setdefault(raw.lower(), []).append(ids)
+        merge = lambda lists: {k: np.unique(np.concatenate(v)).astype("int64") for k, v in lists.items()}
+        return merge(difficulty_ids), merge(topic_ids)
+
+    def ids_for_questions(self, texts):
+        hashes = np.array([question_hash(t) for t in texts], dtype="int64")
+        return self.ids[np.isin(self.question_hashes, hashes)]
@@ -1,22 +1,59 @@
 import os
 import faiss
 import pickle
-from sentence_transformers import SentenceTransformer
+from api.rag.ann_index import AnnIndex, difficulty_labels, topic_matches
+from api.rag.embeddings import get_embedder
+from api.rag.metadata_store import ColumnarMetadata, read_index_mmap
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
 
 class VectorStore:
-    def __init__(self, index_path="rag/index.faiss", meta_path="rag/metadata.pkl"):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, index_path=os.path.join(RAG_DIR, "index.faiss"), meta_path=os.path.join(RAG_DIR, "metadata.pkl"),
+                 columns_path=os.path.join(RAG_DIR, "metadata.cols")):
+        # Shared per process; the model itself loads on the first query (or warm_up)
+        self.embedder = get_embedder()
         self.index = None
+        self.ann = None
         self.metadata = []
         self.index_path = index_path
         self.meta_path = meta_path
+        self.columns_path = columns_path
         self.load_index()
 
     def load_index(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
+        if os.path.exists(self.index_path) and os.path.exists(self.columns_path):
+            # Fast path: both files are mmapped, nothing is decoded until a search returns it
+            self.index = read_index_mmap(self.index_path)
+            self.metadata = ColumnarMetadata(self.columns_path)
+            self.ann = AnnIndex.from_metadata(self.index, self.metadata)
+        elif os.path.exists(self.index_path) and os.path.exists(self.meta_path):
             self.index = faiss.read_index(self.index_path)
             with open(self.meta_path, "rb") as f:
                 self.metadata = pickle.load(f)
+            self.ann = AnnIndex.from_metadata(self.index, self.metadata)
 
     def filter_by_difficulty(self, difficulty):
-        return [m for m in self.metadata if m['difficulty'].lower() == difficulty.lower()]
\ No newline at end of file
+        if self.ann is None:
+            return []
+        return [self.ann.items[vid] for vid in self.ann.ids_for(difficulty=difficulty)]
+
+    @staticmethod
+    def matches_difficulty(item, difficulty):
+        return difficulty.lower() in difficulty_labels(item)
+
+    @staticmethod
+    def matches_topic(item, topic):
+        return topic_matches(str(item.get('topic', '')).lower(), topic.lower())
+
+    def search(self, query, k=5, difficulty=None, topic=None, exclude=None):
+        """
+        Returns up to k (similarity, item) pairs, best first, optionally restricted
+        to a difficulty and topic. `exclude` is a set of question texts to skip.
+        """
+        if self.ann is None or self.index.ntotal == 0:
+            return []
+
+        vector = self.embedder.encode_query(query)
+        exclude_ids = self.ann.ids_for_questions(exclude) if exclude else None
+        hits = self.ann.search(vector, k, difficulty=difficulty, topic=topic, exclude_ids=exclude_ids)[0]
+        return [(similarity, item) for similarity, _, item in hits]
@@ -0,0 +1,328 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+
+# Requests / tokens per minute allowed towards Gemini from this machine
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+# Share the buckets between worker processes through a local SQLite file
+GEMINI_LIMITER_SHARED = os.getenv("GEMINI_LIMITER_SHARED", "1") == "1"
+GEMINI_LIMITER_DB = os.getenv("GEMINI_LIMITER_DB", "/tmp/gemini_limiter.db")
+# Longer than this and we'd rather serve the fallback than keep the user waiting
+GEMINI_LIMITER_MAX_WAIT = float(os.getenv("GEMINI_LIMITER_MAX_WAIT", "10"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+
+POLL_INTERVAL = 0.05
+
+
+def estimate_tokens(text, expected_output=256):
+    """Rough prompt + response token count (~4 chars per token)."""
+    return len(text or "") // 4 + expected_output
+
+
+class LocalTokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute`."""
+
+    def __init__(self, name, per_minute):
+        self.name = name
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, n=1):
+        """Takes n tokens and returns 0, or returns the seconds until n are available."""
+        n = min(n, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    def available(self):
+        with self._lock:
+            return min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+
+    def refund(self, n=1):
+        """Gives back tokens taken by a try_acquire whose call did not go ahead."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(n, self.capacity))
+
+
+class SqliteTokenBucket:
+    """
+    Same contract as LocalTokenBucket, but the bucket lives in a SQLite file so
+    every worker process on the machine draws from one budget.
+    """
+
+    def __init__(self, name, per_minute, path=GEMINI_LIMITER_DB):
+        self.name = name
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, conn, now):
+        row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name=?", (self.name,)).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+
+    def try_acquire(self, n=1):
+        n = min(n, self.capacity)
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            tokens = self._refill(conn, now)
+            wait = 0.0
+            if tokens >= n:
+                tokens -= n
+            else:
+                wait = (n - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                         (self.name, tokens, now))
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def available(self):
+        return self._refill(self._conn(), time.time())
+
+    def refund(self, n=1):
+        n = min(n, self.capacity)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            tokens = min(self.capacity, self._refill(conn, now) + n)
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                         (self.name, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD cap on concurrent upstream calls: +1 slot per limit's worth of
+    successes, halved on every throttle.
+    """
+
+    def __init__(self, max_limit=GEMINI_MAX_CONCURRENCY, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def try_enter(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def enter(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def leave(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit / 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures; half_open lets one probe through after `cooldown`."""
+
+    def __init__(self, threshold=GEMINI_BREAKER_THRESHOLD, cooldown=GEMINI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self):
+        """The admitted probe never reached upstream; let the next call probe instead."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success):
+        with self._lock:
+            self._probe_in_flight = False
+            if success:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class GeminiLimiter:
+    """
+    Gate in front of every Gemini call: circuit breaker, RPM/TPM token buckets
+    and the adaptive concurrency cap. acquire() returning False means "use the
+    fallback path now".
+    """
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, shared=GEMINI_LIMITER_SHARED, max_wait=GEMINI_LIMITER_MAX_WAIT):
+        bucket = SqliteTokenBucket if shared else LocalTokenBucket
+        try:
+            self.rpm = bucket("gemini_rpm", rpm)
+            self.tpm = bucket("gemini_tpm", tpm)
+            self.rpm.available()
+        except Exception as e:
+            print(f"⚠️ Shared limiter unavailable ({e}) - using per-process buckets")
+            self.rpm = LocalTokenBucket("gemini_rpm", rpm)
+            self.tpm = LocalTokenBucket("gemini_tpm", tpm)
+        self.max_wait = max_wait
+        self.concurrency = AdaptiveConcurrency()
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self.counters = {"admitted": 0, "rejected_open": 0, "rejected_wait": 0, "throttled": 0, "waited_ms": 0.0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _bucket_wait(self, tokens):
+        wait = self.rpm.try_acquire(1)
+        if wait:
+            return wait
+        wait = self.tpm.try_acquire(tokens)
+        if wait:
+            # Hand the request slot back, or a caller waiting on TPM drains RPM for everyone
+            self.rpm.refund(1)
+        return wait
+
+    def acquire(self, tokens):
+        if not self.breaker.allow():
+            self._count("rejected_open")
+            return False
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        while True:
+            wait = self._bucket_wait(tokens)
+            if not wait:
+                break
+            if time.monotonic() + wait > deadline:
+                self._count("rejected_wait")
+                self.breaker.release_probe()
+                return False
+            # Jitter so waiting workers don't wake up in lockstep
+            time.sleep(wait * random.uniform(1.0, 1.2))
+        if not self.concurrency.enter(max(0.0, deadline - time.monotonic())):
+            self._count("rejected_wait")
+            self.breaker.release_probe()
+            return False
+        self._count("admitted")
+        self._count("waited_ms", 1000 * (time.monotonic() - started))
+        return True
+
+    async def acquire_async(self, tokens):
+        if not self.breaker.allow():
+            self._count("rejected_open")
+            return False
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        while True:
+            if isinstance(self.rpm, SqliteTokenBucket):
+                wait = await asyncio.to_thread(self._bucket_wait, tokens)
+            else:
+                wait = self._bucket_wait(tokens)
+            if not wait:
+                break
+            if time.monotonic() + wait > deadline:
+                self._count("rejected_wait")
+                self.breaker.release_probe()
+                return False
+            await asyncio.sleep(wait * random.uniform(1.0, 1.2))
+        while not self.concurrency.try_enter():
+            if time.monotonic() >= deadline:
+                self._count("rejected_wait")
+                self.breaker.release_probe()
+                return False
+            await asyncio.sleep(POLL_INTERVAL)
+        self._count("admitted")
+        self._count("waited_ms", 1000 * (time.monotonic() - started))
+        return True
+
+    def release(self, outcome):
+        """outcome: success | throttled | error | ignored (auth/config errors, cancellations)."""
+        self.concurrency.leave(throttled=outcome == "throttled")
+        if outcome == "throttled":
+            self._count("throttled")
+        if outcome in ("success", "throttled", "error"):
+            self.breaker.record(outcome == "success")
+        else:
+            self.breaker.release_probe()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["waited_ms"] = round(counters["waited_ms"], 3)
+        return {
+            "shared": isinstance(self.rpm, SqliteTokenBucket),
+            "rpm_available": round(self.rpm.available(), 2),
+            "tpm_available": round(self.tpm.available(), 2),
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "trips": self.breaker.trips,
+            },
+            **counters,
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one upstream call whose
+    result is fanned out to every caller. Works for threads (do) and for
+    coroutines on the same event loop (do_async).
+
+    Callers that wait longer than `timeout` for someone else's call get
+    `default` back instead of blocking further. An async call is cancelled
+    once every caller waiting on it has been cancelled or timed out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}   # key -> _Call
+        self._tasks = {}   # (loop id, key) -> _Flight
+        self.counters = {"leaders": 0, "coalesced": 0, "timeouts": 0, "abandoned": 0}
+
+    def do(self, key, fn, timeout, default=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.counters["leaders"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self._lock:
+                self.counters["timeouts"] += 1
+            return default
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key, coro_fn, timeout, default=None):
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            flight = self._tasks.get(task_key)
+            if flight is None:
+                # The shared call runs as its own task so one caller going away
+                # (client disconnect) does not cancel it for everyone else
+                flight = _Flight(loop.create_task(coro_fn()))
+                self._tasks[task_key] = flight
+                flight.task.add_done_callback(lambda _: self._forget(task_key, flight))
+                self.counters["leaders"] += 1
+            else:
+                self.counters["coalesced"] += 1
+            flight.waiters += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), timeout=timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.counters["timeouts"] += 1
+            return default
+        finally:
+            # The last waiter leaving (cancelled or timed out) takes the upstream call with it
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and not flight.task.done()
+                if abandoned:
+                    self._forget_locked(task_key, flight)
+                    self.counters["abandoned"] += 1
+            if abandoned:
+                flight.task.cancel()
+
+    def _forget(self, task_key, flight):
+        with self._lock:
+            self._forget_locked(task_key, flight)
+
+    def _forget_locked(self, task_key, flight):
+        # A newer call may already own the key
+        if self._tasks.get(task_key) is flight:
+            del self._tasks[task_key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self._calls) + len(self._tasks)
+        return stats
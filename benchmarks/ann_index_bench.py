@@ -0,0 +1,97 @@
+"""
+Recall vs latency of the question bank index on synthetic corpora.
+
+    python benchmarks/ann_index_bench.py --sizes 1000,10000,100000,1000000
+
+For each corpus size, builds every index kind (flat / hnsw / ivf), and reports
+build time, recall@k against exact search, and p50/p99 query latency, both
+unfiltered and with a difficulty + topic filter.
+"""
+import argparse
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import numpy as np
+from api.latency import LatencyWindow
+from api.rag.ann_index import AnnIndex, choose_index_kind, normalize
+
+DIFFICULTIES = ["Easy", "Medium", "Hard", "Medium/Hard"]
+TOPICS = ["DSA", "DBMS", "OS", "CN", "Java", "Python", "System Design", "SQL Joins", "ECE - Digital", "HR"]
+
+
+def make_corpus(n, dim, rng, clusters=64):
+    # Clustered data is closer to real embeddings than uniform noise
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim)).astype("float32")
+    items = [
+        {"id": i, "difficulty": DIFFICULTIES[i % len(DIFFICULTIES)], "topic": TOPICS[(i // 7) % len(TOPICS)], "question": f"Q{i}"}
+        for i in range(n)
+    ]
+    return normalize(vectors), items
+
+
+def ground_truth(vectors, queries, k, allowed=None):
+    ids = np.arange(len(vectors)) if allowed is None else allowed
+    scores = queries @ vectors[ids].T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [set(ids[row].tolist()) for row in top]
+
+
+def run_queries(ann, queries, k, **filters):
+    window = LatencyWindow(size=len(queries))
+    found = []
+    for q in queries:
+        started = time.perf_counter()
+        hits = ann.search(q, k, **filters)[0]
+        window.record(time.perf_counter() - started)
+        found.append({vid for _, vid, _ in hits})
+    return found, window.stats()
+
+
+def recall(found, truth):
+    return float(np.mean([len(f & t) / max(1, len(t)) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--kinds", default="flat,hnsw,ivf")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'n':>9} {'kind':>5} {'auto':>5} {'build_s':>8} {'filter':>8} {'recall':>7} {'p50_ms':>8} {'p99_ms':>8}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        vectors, items = make_corpus(n, args.dim, rng)
+        queries = normalize(vectors[rng.integers(0, n, args.queries)] + 0.1 * rng.normal(size=(args.queries, args.dim)))
+        filters = {"difficulty": "Hard", "topic": "DSA"}
+
+        truth = None
+        for kind in args.kinds.split(","):
+            started = time.perf_counter()
+            ann = AnnIndex.build(vectors, items, kind=kind)
+            build_s = time.perf_counter() - started
+            if truth is None:
+                truth = {
+                    "none": ground_truth(vectors, queries, args.k),
+                    "filtered": ground_truth(vectors, queries, args.k, ann.ids_for(**filters)),
+                }
+
+            auto = "*" if choose_index_kind(n) == kind else ""
+            for label, kwargs in (("none", {}), ("filtered", filters)):
+                found, latency = run_queries(ann, queries, args.k, **kwargs)
+                print(f"{n:>9} {kind:>5} {auto:>5} {build_s:>8.2f} {label:>8} {recall(found, truth[label]):>7.3f} "
+                      f"{latency['p50_ms']:>8.3f} {latency['p99_ms']:>8.3f}")
+            del ann
+
+
+if __name__ == "__main__":
+    main()
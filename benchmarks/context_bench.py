@@ -0,0 +1,100 @@
+"""
+Prompt size (and optionally generation latency) of question prompts: raw history repr vs ContextBuilder.
+
+    python benchmarks/context_bench.py --turns 1,3,5,10,20
+    GOOGLE_API_KEY=... python benchmarks/context_bench.py --live --calls 5
+
+Builds synthetic sessions with verbose answers and feedback, and counts prompt
+tokens for the old prompt ("Recent conversation: {history[-3:]}") and the
+budgeted one. With --live, both prompts also go to Gemini and p50 generation
+latency is reported per variant.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from api.context_builder import ContextBuilder, count_tokens
+from api.latency import LatencyWindow
+from api.question_engine import QuestionEngine
+
+TOPIC, DIFFICULTY, LEVEL = "DBMS", "Medium", "Fresher"
+
+
+def legacy_prompt(topic, difficulty, level, history):
+    """The prompt QuestionEngine built before the context builder."""
+    history_text = ""
+    if history:
+        history_text = f"Recent conversation: {history[-3:]}"
+    return f"""
+        You are a technical interviewer.
+        Topic: {topic}
+        Difficulty: {difficulty}
+        Candidate Level: {level}
+        {history_text}
+        Generate the next interview question. Keep it concise and relevant. Do not include the answer.
+        """
+
+
+def make_history(turns, answer_words):
+    history = [{"meta": "init", "topic": TOPIC, "level": LEVEL}]
+    for i in range(turns):
+        history.append({
+            "question": f"Question {i}: explain how database indexing affects query performance in scenario {i}, with examples?",
+            "answer": " ".join(f"answer{i}word{j}" for j in range(answer_words)),
+            "score": (i * 3) % 11,
+            "feedback": "You covered B-tree basics but skipped clustered vs non-clustered indexes, "
+                        "write amplification and when the planner ignores an index. " * 3,
+        })
+    return history
+
+
+async def generation_latency(client, prompt, calls):
+    window = LatencyWindow(size=calls)
+    for _ in range(calls):
+        started = time.perf_counter()
+        await client.generate_async(prompt)
+        window.record(time.perf_counter() - started)
+    return window.stats()["p50_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", default="1,3,5,10,20")
+    parser.add_argument("--answer-words", type=int, default=250)
+    parser.add_argument("--budget", type=int, default=None, help="defaults to HISTORY_TOKEN_BUDGET")
+    parser.add_argument("--live", action="store_true", help="also time real Gemini calls (uses quota)")
+    parser.add_argument("--calls", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = QuestionEngine(retrieval_first=False)
+    if args.budget is not None:
+        engine.context = ContextBuilder(budget=args.budget)
+    if args.live and not engine.client.model:
+        print("❌ --live needs a configured GOOGLE_API_KEY")
+        sys.exit(1)
+
+    header = f"{'turns':>5} {'old_tokens':>10} {'new_tokens':>10} {'saved':>6}"
+    if args.live:
+        header += f" {'old_p50_ms':>10} {'new_p50_ms':>10}"
+    print(header)
+    for turns in [int(t) for t in args.turns.split(",")]:
+        history = make_history(turns, args.answer_words)
+        old = legacy_prompt(TOPIC, DIFFICULTY, LEVEL, history)
+        new = engine.build_prompt(TOPIC, DIFFICULTY, LEVEL, history)
+        old_tokens, new_tokens = count_tokens(old), count_tokens(new)
+        row = f"{turns:>5} {old_tokens:>10} {new_tokens:>10} {1 - new_tokens / old_tokens:>6.0%}"
+        if args.live:
+            old_ms = asyncio.run(generation_latency(engine.client, old, args.calls))
+            new_ms = asyncio.run(generation_latency(engine.client, new, args.calls))
+            row += f" {old_ms:>10.0f} {new_ms:>10.0f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Encode throughput and query latency of each embedding backend.
+
+    python benchmarks/embedding_bench.py --backends sentence-transformers,onnx
+
+For each backend: model load time, batch encode throughput, p50/p99 latency of
+single uncached queries (what a question-bank lookup pays), and p50/p99 of
+repeated queries served from the LRU. Backends whose dependencies are missing
+are reported and skipped.
+"""
+import argparse
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from api.latency import LatencyWindow
+from api.rag.embeddings import BACKENDS, Embedder
+
+TOPICS = ["DSA", "DBMS", "Operating Systems", "Computer Networks", "Java", "Python", "System Design", "SQL"]
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+
+def make_texts(n):
+    return [
+        f"{TOPICS[i % len(TOPICS)]} {DIFFICULTIES[i % 3]} question {i}: explain how "
+        f"{TOPICS[(i * 7) % len(TOPICS)].lower()} handles case number {i} in practice"
+        for i in range(n)
+    ]
+
+
+def timed(fn, texts):
+    window = LatencyWindow(size=len(texts))
+    for text in texts:
+        started = time.perf_counter()
+        fn(text)
+        window.record(time.perf_counter() - started)
+    return window.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--texts", type=int, default=2000, help="batch size for the throughput run")
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts)
+    queries = make_texts(args.texts + args.queries)[args.texts:]
+
+    print(f"{'backend':>22} {'load_s':>7} {'texts/s':>9} {'q_p50_ms':>9} {'q_p99_ms':>9} {'hit_p50_ms':>11} {'hit_p99_ms':>11}")
+    for name in args.backends.split(","):
+        embedder = Embedder(backend=name, cache_size=args.queries)
+        try:
+            load_s = embedder.warm_up()
+        except Exception as e:
+            print(f"{name:>22} skipped: {e}")
+            continue
+
+        started = time.perf_counter()
+        embedder.encode(texts)
+        throughput = len(texts) / (time.perf_counter() - started)
+
+        cold = timed(embedder.encode_query, queries)
+        hot = timed(embedder.encode_query, queries)
+        print(f"{name:>22} {load_s:>7.2f} {throughput:>9.0f} {cold['p50_ms']:>9.3f} {cold['p99_ms']:>9.3f} "
+              f"{hot['p50_ms']:>11.4f} {hot['p99_ms']:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Evaluation reply parsing: the old greedy regex + json.loads vs parse_evaluation().
+
+    python benchmarks/eval_parse_bench.py --replies 20000
+
+Replies mix what Gemini actually returns: bare JSON (structured output),
+JSON inside a markdown fence, JSON with prose before and after it, and
+out-of-range or broken replies. Reports us/reply and how many replies
+each parser accepts and how many of those are usable.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from api.evaluator import parse_evaluation, validate_evaluation, _loads
+
+
+def legacy_parse(text):
+    """What Evaluator.parse_response did before structured output."""
+    try:
+        match = re.search(r'\{.*\}', text, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
+    except Exception:
+        pass
+    return None
+
+
+def make_replies(count, feedback_words, seed=0):
+    rng = random.Random(seed)
+    replies = []
+    for i in range(count):
+        body = json.dumps({
+            "score": rng.randint(0, 10),
+            "feedback": " ".join(rng.choice(["index", "scan", "join", "lock", "cache"]) for _ in range(feedback_words)),
+            "correct_solution": "Use a B-tree index on the filtered column {id}.",
+        })
+        kind = i % 5
+        if kind == 1:
+            body = f"```json\n{body}\n```"
+        elif kind == 2:
+            body = f"Here is the evaluation: {body}\nLet me know if you need {{more}} detail."
+        elif kind == 3:
+            body = body.replace('"score": ', '"score": 1', 1)  # out of range
+        elif kind == 4 and i % 10 == 4:
+            body = body[:-5]  # truncated
+        replies.append(body)
+    return replies
+
+
+def bench(parse, replies):
+    """(us per reply, parsed results); parse returns a result or None."""
+    started = time.perf_counter()
+    results = [parse(r) for r in replies]
+    return 1e6 * (time.perf_counter() - started) / len(replies), [r for r in results if r is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=20000)
+    parser.add_argument("--feedback-words", type=int, default=60)
+    args = parser.parse_args()
+
+    replies = make_replies(args.replies, args.feedback_words)
+    print(f"JSON backend: {_loads.__module__}")
+    print(f"{'parser':>18} {'us/reply':>9} {'accepted':>9} {'usable':>9}")
+    parsers = (("legacy regex", legacy_parse), ("parse_evaluation", lambda r: parse_evaluation(r)[0]))
+    for name, parse in parsers:
+        us, results = bench(parse, replies)
+        # Usable = would not skew DifficultyController (score in 0-10, feedback present)
+        usable = sum(1 for r in results if validate_evaluation(r)[0] is not None)
+        print(f"{name:>18} {us:>9.1f} {len(results):>9} {usable:>9}")
+
+
+if __name__ == "__main__":
+    main()
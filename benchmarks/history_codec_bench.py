@@ -0,0 +1,137 @@
+"""
+Session turn storage: plain JSON/TEXT columns vs the msgpack+zstd codec.
+
+    python benchmarks/history_codec_bench.py                # 1M turns
+    python benchmarks/history_codec_bench.py --turns 100000 --sample 500
+
+Writes the same synthetic interviews (--turns-per-session turns each, saved
+with update_session) into a fresh SQLite file per codec, each in its own
+process since the codec is read from the environment. For each codec it
+reports:
+- file size after VACUUM, and bytes per turn
+- write throughput in turns/s
+- get_session decode time per turn on --sample random sessions, with the
+  session cache off so every call reads the rows
+
+The json database is then converted in place with rewrite_legacy_turns, the
+same pass the server runs in the background, and its throughput and final
+size are reported. SQLite only: on Postgres, TOAST already compresses text
+values over ~2 kB, so the size gain there is smaller for long answers.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+WORDS = [
+    "index", "query", "join", "latency", "thread", "process", "memory", "cache", "lock", "page",
+    "tree", "hash", "table", "row", "column", "transaction", "commit", "rollback", "deadlock", "scheduler",
+    "kernel", "socket", "packet", "router", "layer", "protocol", "stack", "queue", "heap", "graph",
+    "node", "edge", "pointer", "array", "string", "integer", "function", "closure", "object", "class",
+]
+
+
+def text_pool(rng, count, min_words, max_words):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+            for _ in range(count)]
+
+
+def make_sessions(turns, per_session, seed=0):
+    """(session_id, history) pairs; answers and feedback come from pools so generation stays fast."""
+    rng = random.Random(seed)
+    answers = text_pool(rng, 2000, 40, 200)
+    feedbacks = text_pool(rng, 2000, 15, 60)
+    for s in range((turns + per_session - 1) // per_session):
+        history = [{"meta": "init", "topic": rng.choice(["DBMS", "OS", "CN", "DSA"]), "level": "Fresher"}]
+        for t in range(min(per_session, turns - s * per_session)):
+            history.append({
+                "question": f"Question {t} about {rng.choice(WORDS)} and {rng.choice(WORDS)}?",
+                "answer": rng.choice(answers),
+                "score": rng.randint(0, 10),
+                "feedback": rng.choice(feedbacks),
+            })
+        yield f"bench-{s:07d}", history
+
+
+def file_size(database, path):
+    with database.db_connection() as (conn, _):
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        # VACUUM writes the rebuilt pages to the WAL; fold them back into the main file
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    wal = path + "-wal"
+    return os.path.getsize(path) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+
+
+def worker(args):
+    """Runs one codec in this process; prints its results as JSON on the last line."""
+    from api import database, history_codec
+
+    database.ensure_schema()
+    started = time.perf_counter()
+    sessions = 0
+    for session_id, history in make_sessions(args.turns, args.turns_per_session):
+        database.update_session(session_id, "Medium", history, user_id=f"user-{sessions % 1000}")
+        sessions += 1
+    write_s = time.perf_counter() - started
+    result = {"codec": history_codec.SESSION_TURN_CODEC, "write_tps": args.turns / write_s,
+              "size": file_size(database, database.SQLITE_PATH)}
+
+    rng = random.Random(1)
+    sample = [f"bench-{rng.randrange(sessions):07d}" for _ in range(args.sample)]
+    started = time.perf_counter()
+    read_turns = sum(len(database.get_session(session_id)[1]) - 1 for session_id in sample)
+    result["decode_us"] = 1e6 * (time.perf_counter() - started) / read_turns
+
+    if not history_codec.compact_enabled():
+        history_codec.SESSION_TURN_CODEC = "msgpack-zstd"
+        started = time.perf_counter()
+        converted, after = 0, ("", 0)
+        while after is not None:
+            n, after = database.rewrite_legacy_turns(after)
+            converted += n
+        result["rewrite_tps"] = converted / (time.perf_counter() - started)
+        result["rewritten_size"] = file_size(database, database.SQLITE_PATH)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1_000_000)
+    parser.add_argument("--turns-per-session", type=int, default=20)
+    parser.add_argument("--sample", type=int, default=2000, help="sessions read back for decode timing")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    tmp = tempfile.mkdtemp()
+    print(f"{args.turns} turns, {args.turns_per_session} per session, files in {tmp}")
+    print(f"{'codec':>13} {'size MB':>8} {'B/turn':>7} {'write turns/s':>14} {'decode us/turn':>15}")
+    results = []
+    for codec in ("json", "msgpack-zstd"):
+        env = dict(os.environ, SESSION_TURN_CODEC=codec, SESSION_CACHE_SIZE="0",
+                   SQLITE_PATH=os.path.join(tmp, f"{codec}.db"), TURN_REWRITE_PAUSE="0")
+        env.pop("DATABASE_URL", None)
+        out = subprocess.run([sys.executable, __file__, "--worker", "--turns", str(args.turns),
+                              "--turns-per-session", str(args.turns_per_session), "--sample", str(args.sample)],
+                             env=env, check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        results.append(r)
+        print(f"{codec:>13} {r['size'] / 1e6:>8.1f} {r['size'] / args.turns:>7.0f} {r['write_tps']:>14.0f} {r['decode_us']:>15.2f}")
+
+    legacy = results[0]
+    print(f"\nBackground rewrite of the json database: {legacy['rewrite_tps']:.0f} turns/s, "
+          f"{legacy['size'] / 1e6:.1f} MB -> {legacy['rewritten_size'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Load time and memory of the question bank: pickle + in-RAM index vs columnar + mmap.
+
+    python benchmarks/index_load_bench.py --items 200000 --dim 384
+
+Writes a synthetic bank to a temp directory in both formats, then loads each in
+a fresh subprocess (so nothing is already imported or cached in-process) and
+reports load time, first-search time and RSS. RssAnon is private memory;
+RssFile is page cache that other workers mapping the same files share.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import faiss
+import numpy as np
+from api.rag.ann_index import AnnIndex, normalize
+
+
+def memory():
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) // 1024
+    return fields
+
+
+def child(fmt, directory, dim):
+    # Import cost is not part of the load being measured
+    from api.rag.metadata_store import ColumnarMetadata, read_index_mmap
+    import pickle
+
+    before = memory()
+    started = time.perf_counter()
+    if fmt == "pickle":
+        index = faiss.read_index(os.path.join(directory, "index.faiss"))
+        with open(os.path.join(directory, "metadata.pkl"), "rb") as f:
+            metadata = pickle.load(f)
+    else:
+        index = read_index_mmap(os.path.join(directory, "index.faiss"))
+        metadata = ColumnarMetadata(os.path.join(directory, "metadata.cols"))
+    ann = AnnIndex.from_metadata(index, metadata)
+    load_s = time.perf_counter() - started
+
+    query = normalize(np.random.default_rng(1).normal(size=(1, dim)))
+    started = time.perf_counter()
+    ann.search(query, 5, difficulty="Medium", topic="DSA")
+    search_ms = 1000 * (time.perf_counter() - started)
+
+    after = memory()
+    print(json.dumps({
+        "format": fmt,
+        "load_s": round(load_s, 3),
+        "first_search_ms": round(search_ms, 2),
+        "rss_mb": after["VmRSS"] - before["VmRSS"],
+        "anon_mb": after["RssAnon"] - before["RssAnon"],
+        "file_mb": after["RssFile"] - before["RssFile"],
+    }))
+
+
+def write_bank(directory, n, dim):
+    from api.rag.ingest import write_columns, write_pickle
+
+    rng = np.random.default_rng(0)
+    topics = ["DSA", "DBMS", "OS", "CN", "Java", "Python", "System Design", "HR"]
+    items = [
+        {
+            "id": i,
+            "topic": topics[i % len(topics)],
+            "difficulty": ["Easy", "Medium", "Hard"][i % 3],
+            "question": f"Synthetic question {i} about {topics[i % len(topics)]}?",
+            "expected_answer": f"Model answer {i}: " + "a reasonably long explanation " * 8,
+        }
+        for i in range(n)
+    ]
+    ann = AnnIndex.build(rng.normal(size=(n, dim)).astype("float32"), items, kind="flat")
+    faiss.write_index(ann.index, os.path.join(directory, "index.faiss"))
+    write_pickle(os.path.join(directory, "metadata.pkl"), items)
+    write_columns(os.path.join(directory, "metadata.cols"), items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--child", choices=["pickle", "columnar"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.dir, args.dim)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Writing {args.items} items (dim {args.dim})...")
+        write_bank(directory, args.items, args.dim)
+        for name in ("index.faiss", "metadata.pkl", "metadata.cols"):
+            print(f"  {name}: {os.path.getsize(os.path.join(directory, name)) / 2**20:.1f} MB")
+
+        print(f"{'format':>9} {'load_s':>7} {'search_ms':>10} {'rss_mb':>7} {'anon_mb':>8} {'file_mb':>8}")
+        for fmt in ("pickle", "columnar"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", fmt, "--dir", directory, "--dim", str(args.dim)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['format']:>9} {r['load_s']:>7.3f} {r['first_search_ms']:>10.2f} {r['rss_mb']:>7} {r['anon_mb']:>8} {r['file_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
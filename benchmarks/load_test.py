@@ -0,0 +1,265 @@
+"""
+Load test of api/main.py against the Gemini stub, with per-endpoint RPS and latency percentiles.
+
+    python benchmarks/load_test.py --users 20 --duration 30 --save benchmarks/baselines/sqlite.json
+    python benchmarks/load_test.py --db postgres --database-url postgresql://localhost/interview_bench \\
+        --compare benchmarks/baselines/postgres.json
+
+By default this starts benchmarks/stub_gemini.py and a uvicorn server for
+api.main:app (SQLite in a temp file, or --database-url for Postgres). It then runs
+--users virtual candidates through full interviews:
+- /start_interview
+- --turns rounds of /get_question -> /submit_answer
+- /my_sessions
+and repeats until --duration is up.
+
+Results are printed per endpoint and can be saved as a JSON baseline.
+--compare flags any endpoint whose p95/p99 grew, or whose RPS fell, by more
+than --tolerance, and exits non-zero. Needs httpx.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import httpx
+from api.latency import LatencyWindow
+
+TOPICS = ["DSA", "DBMS", "Operating Systems", "Python", "System Design", "SQL"]
+LEVELS = ["Fresher", "Intermediate", "Experienced"]
+# Gemini-side limits are what the stub is standing in for, so lift the client's own
+LOAD_TEST_ENV = {"GEMINI_RPM": "1000000", "GEMINI_TPM": "1000000000"}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.samples.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            endpoints[endpoint] = {
+                "count": len(ordered),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(ordered) / elapsed, 2),
+                **{f"p{pct}_ms": round(1000 * LatencyWindow.percentile(ordered, pct), 1) for pct in (50, 95, 99)},
+            }
+        total = sum(e["count"] for e in endpoints.values())
+        return {"elapsed_s": round(elapsed, 1), "total_rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+
+async def timed(recorder, endpoint, request):
+    started = time.perf_counter()
+    try:
+        response = await request
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        response, ok = None, False
+    recorder.record(endpoint, time.perf_counter() - started, ok)
+    return response if ok else None
+
+
+async def virtual_user(client, recorder, user_no, turns, deadline):
+    rng = random.Random(user_no)
+    user_id = f"load-user-{user_no}"
+    interview = 0
+    while time.perf_counter() < deadline:
+        interview += 1
+        start = await timed(recorder, "POST /start_interview", client.post("/start_interview", json={
+            "user_id": user_id, "topic": rng.choice(TOPICS), "experience_level": rng.choice(LEVELS),
+        }))
+        if start is None:
+            await asyncio.sleep(1)
+            continue
+        session_id = start.json()["session_id"]
+
+        for turn in range(turns):
+            if time.perf_counter() >= deadline:
+                break
+            question = await timed(recorder, "GET /get_question", client.get(f"/get_question/{session_id}"))
+            if question is None:
+                break
+            # Unique answers, so the evaluation cache does not short-circuit the LLM path
+            answer = f"User {user_no} interview {interview} turn {turn}: " + " ".join(rng.choice(
+                ["index", "hash", "latency", "lock", "cache", "queue", "tree", "join"]) for _ in range(40))
+            await timed(recorder, "POST /submit_answer", client.post("/submit_answer", json={
+                "session_id": session_id, "question_text": question.json().get("question", ""), "answer": answer,
+            }))
+
+        await timed(recorder, "GET /my_sessions", client.get(f"/my_sessions/{user_id}"))
+
+
+async def run_load(base_url, users, turns, duration, timeout):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(client, recorder, n, turns, deadline) for n in range(users)))
+        elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed)
+
+
+def wait_until_up(url, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def compare(result, baseline, tolerance):
+    """Human-readable regressions of result vs baseline."""
+    regressions = []
+    for endpoint, base in baseline["endpoints"].items():
+        current = result["endpoints"].get(endpoint)
+        if current is None:
+            regressions.append(f"{endpoint}: missing from this run")
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{endpoint}: {key} {base[key]} -> {current[key]}")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: rps {base['rps']} -> {current['rps']}")
+    return regressions
+
+
+def print_summary(result, baseline=None):
+    print(f"\n{'endpoint':>22} {'count':>7} {'errors':>7} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for endpoint, e in result["endpoints"].items():
+        line = f"{endpoint:>22} {e['count']:>7} {e['errors']:>7} {e['rps']:>8.2f} {e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f}"
+        base = baseline["endpoints"].get(endpoint) if baseline else None
+        if base and base["p95_ms"]:
+            line += f"   (p95 {100 * (e['p95_ms'] / base['p95_ms'] - 1):+.0f}% vs baseline)"
+        print(line)
+    print(f"{'total':>22} {'':>7} {'':>7} {result['total_rps']:>8.2f}   over {result['elapsed_s']}s")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3, help="question/answer rounds per interview")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--database-url", help="Postgres DSN for --db postgres (use a throwaway database)")
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--app-port", type=int, default=8010)
+    parser.add_argument("--stub-port", type=int, default=8787)
+    parser.add_argument("--stub-latency-ms", type=float, default=500.0)
+    parser.add_argument("--stub-sigma", type=float, default=0.4)
+    parser.add_argument("--stub-rate-429", type=float, default=0.0)
+    parser.add_argument("--base-url", help="load an already running server instead of starting one")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request client timeout")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    if args.db == "postgres" and not args.database_url and not args.base_url:
+        parser.error("--db postgres needs --database-url")
+
+    procs = []
+    tmpdir = tempfile.TemporaryDirectory()
+    base_url = args.base_url
+    try:
+        if not base_url:
+            stub_url = f"http://127.0.0.1:{args.stub_port}"
+            stub = subprocess.Popen([
+                sys.executable, os.path.join(project_root, "benchmarks", "stub_gemini.py"),
+                "--port", str(args.stub_port), "--latency-ms", str(args.stub_latency_ms),
+                "--sigma", str(args.stub_sigma), "--rate-429", str(args.stub_rate_429),
+            ])
+            procs.append(stub)
+            wait_until_up(f"{stub_url}/stats", stub)
+
+            env = dict(os.environ, **LOAD_TEST_ENV,
+                       GOOGLE_API_KEY="AIza" + "0" * 35, GEMINI_API_ENDPOINT=stub_url,
+                       EVAL_CACHE_PERSISTENT="0", GEMINI_LIMITER_DB=os.path.join(tmpdir.name, "limiter.db"))
+            if args.db == "postgres":
+                env["DATABASE_URL"] = args.database_url
+            else:
+                env.pop("DATABASE_URL", None)
+                env["SQLITE_PATH"] = os.path.join(tmpdir.name, "interview.db")
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            app = subprocess.Popen([
+                sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(args.app_port),
+                "--workers", str(args.app_workers), "--log-level", "warning",
+            ], cwd=project_root, env=env, stdout=subprocess.DEVNULL)
+            procs.append(app)
+            wait_until_up(f"{base_url}/health", app)
+
+        print(f"🚦 {args.users} users x {args.duration:.0f}s against {base_url} ({args.db})")
+        result = asyncio.run(run_load(base_url, args.users, args.turns, args.duration, args.timeout))
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        tmpdir.cleanup()
+
+    result["meta"] = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "db": args.db,
+        "users": args.users,
+        "turns": args.turns,
+        "duration_s": args.duration,
+        "app_workers": args.app_workers,
+        "stub": {"latency_ms": args.stub_latency_ms, "sigma": args.stub_sigma, "rate_429": args.stub_rate_429},
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_summary(result, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Baseline saved to {args.save}")
+
+    if baseline:
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Within {args.tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
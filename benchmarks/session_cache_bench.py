@@ -0,0 +1,131 @@
+"""
+Database round trips and latency per interview turn, with and without the session cache.
+
+    python benchmarks/session_cache_bench.py --sessions 50 --turns 10
+    DATABASE_URL=postgresql://localhost/interview_bench python benchmarks/session_cache_bench.py
+
+A turn is the database work of one /get_question + /submit_answer pair:
+get_session, get_session again, then append_turn. Each mode runs the same
+interviews:
+- off: no cache
+- validated: the default; each hit is confirmed with a version read
+- trusted: SESSION_CACHE_VALIDATE=0, for single-worker deployments
+
+For each mode it reports connections, statements and commits per turn, and
+ms per turn. Uses SQLITE_PATH (a temp file by default) or DATABASE_URL.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "session_cache_bench.db"))
+
+from api import database
+
+
+class Counts:
+    def __init__(self):
+        self.connections = self.statements = self.commits = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, counts):
+        self._cursor, self._counts = cursor, counts
+
+    def execute(self, *args, **kwargs):
+        self._counts.statements += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counts.statements += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, conn, counts):
+        self._conn, self._counts = conn, counts
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counts)
+
+    def commit(self):
+        self._counts.commits += 1
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def counting(original, counts):
+    @contextmanager
+    def db_connection():
+        counts.connections += 1
+        with original() as (conn, db_type):
+            yield (CountingConnection(conn, counts) if conn else None), db_type
+    return db_connection
+
+
+def run_mode(name, cache_size, validate, sessions, turns):
+    database._session_cache = database.SessionCache(cache_size)
+    database.SESSION_CACHE_VALIDATE = validate
+    ids = [f"bench-{name}-{uuid.uuid4()}" for _ in range(sessions)]
+    for session_id in ids:
+        database.update_session(session_id, "Easy", [{"meta": "init", "topic": "DBMS", "level": "Fresher"}], user_id="bench")
+
+    counts = Counts()
+    original = database.db_connection
+    database.db_connection = counting(original, counts)
+    started = time.perf_counter()
+    try:
+        # Round-robin over sessions, like concurrent candidates on one worker
+        for turn in range(turns):
+            for session_id in ids:
+                # /get_question, then /submit_answer
+                database.get_session(session_id)
+                difficulty, history = database.get_session(session_id)
+                database.append_turn(session_id, difficulty, {
+                    "question": f"Question {turn}?", "answer": "An answer " * 40, "score": 7, "feedback": "Feedback " * 20,
+                })
+    finally:
+        database.db_connection = original
+    elapsed = time.perf_counter() - started
+
+    n = sessions * turns
+    return {
+        "mode": name,
+        "connections": counts.connections / n,
+        "statements": counts.statements / n,
+        "commits": counts.commits / n,
+        "ms": 1000 * elapsed / n,
+        "hit_rate": database.session_cache_stats()["hit_rate"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    database.ensure_schema()
+    print(f"Backend: {'postgres' if database.DATABASE_URL else 'sqlite ' + database.SQLITE_PATH}")
+    print(f"{'mode':>10} {'conns/turn':>10} {'stmts/turn':>10} {'commits/turn':>12} {'ms/turn':>8} {'hit_rate':>8}")
+    for name, size, validate in (("off", 0, True), ("validated", 4096, True), ("trusted", 4096, False)):
+        r = run_mode(name, size, validate, args.sessions, args.turns)
+        print(f"{r['mode']:>10} {r['connections']:>10.1f} {r['statements']:>10.1f} {r['commits']:>12.1f} {r['ms']:>8.2f} {r['hit_rate']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
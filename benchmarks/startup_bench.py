@@ -0,0 +1,128 @@
+"""
+Cold-start cost of the serverless entry point (api/index.py -> api/main.py).
+
+    python benchmarks/startup_bench.py --runs 5 --max-import-ms 1500
+
+Each run is a fresh interpreter started with -X importtime. It reports:
+- the wall time of `import api.index`
+- the time to the first /health response, driven straight through ASGI
+- the slowest imports, by cumulative time
+
+It exits non-zero if:
+- a module that should load lazily was imported at startup (google.generativeai,
+  sentence_transformers, torch, faiss, onnxruntime), or
+- the median import time is over --max-import-ms.
+CI runs it as a regression gate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Must only be imported on first use, never on a cold start
+LAZY_MODULES = ("google.generativeai", "sentence_transformers", "torch", "faiss", "onnxruntime")
+
+
+async def asgi_get(app, path):
+    messages = []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+
+def child():
+    started = time.perf_counter()
+    from api.index import app
+    import_ms = 1000 * (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    status = asyncio.run(asgi_get(app, "/health"))
+    health_ms = 1000 * (time.perf_counter() - started)
+
+    print(json.dumps({
+        "import_ms": round(import_ms, 1),
+        "first_health_ms": round(health_ms, 1),
+        "health_status": status,
+        "lazy_loaded": [m for m in LAZY_MODULES if m in sys.modules],
+    }))
+
+
+def parse_importtime(stderr):
+    """{module: cumulative_us} from -X importtime output."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = [field.strip() for field in line[len("import time:"):].split("|")]
+        if cumulative_us.isdigit():  # skips the header line
+            cumulative[name] = max(cumulative.get(name, 0), int(cumulative_us))
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    results, imports = [], {}
+    for _ in range(args.runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", __file__, "--child"],
+                              capture_output=True, text=True, cwd=project_root, check=True)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        for name, us in parse_importtime(proc.stderr).items():
+            imports.setdefault(name, []).append(us)
+
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    health_ms = statistics.median(r["first_health_ms"] for r in results)
+    print(f"import api.index: median {import_ms:.1f} ms (min {min(r['import_ms'] for r in results):.1f}, runs {args.runs})")
+    print(f"first /health:    median {health_ms:.1f} ms (status {results[-1]['health_status']})")
+
+    print("\nSlowest imports (median cumulative ms, -X importtime):")
+    slowest = sorted(((statistics.median(v) / 1000, name) for name, v in imports.items()), reverse=True)[:args.top]
+    for ms, name in slowest:
+        print(f"  {ms:>8.1f}  {name}")
+
+    failures = []
+    lazy_loaded = sorted({m for r in results for m in r["lazy_loaded"]})
+    if lazy_loaded:
+        failures.append(f"imported at startup but should be lazy: {', '.join(lazy_loaded)}")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"median import {import_ms:.1f} ms > budget {args.max_import_ms:.1f} ms")
+    if any(r["health_status"] != 200 for r in results):
+        failures.append("/health did not return 200")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Startup within budget")
+
+
+if __name__ == "__main__":
+    main()
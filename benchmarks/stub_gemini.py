@@ -0,0 +1,128 @@
+"""
+Stub of the Gemini REST API for load tests, so they don't spend real quota.
+
+    python benchmarks/stub_gemini.py --port 8787 --latency-ms 600 --sigma 0.4 --rate-429 0.02
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8787 GOOGLE_API_KEY=AIza... uvicorn api.main:app
+
+Serves generateContent and streamGenerateContent. Latency is log-normal around
+--latency-ms; streamed responses split the same total latency across chunks.
+A --rate-429 fraction of calls get HTTP 429 RESOURCE_EXHAUSTED. Replies are canned
+per prompt type:
+- evaluation prompts get a JSON evaluation
+- batch evaluation prompts get a JSON array keyed by the input ids
+- anything else gets an interview question
+GET /stats returns request and error counters.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STREAM_CHUNKS = 4
+BATCH_ID_RE = re.compile(r'\{"id": (\d+), "question"')
+
+app = FastAPI(title="Gemini stub")
+config = {"latency_ms": 500.0, "sigma": 0.4, "rate_429": 0.0, "seed": None}
+stats = {"requests": 0, "streamed": 0, "throttled": 0, "by_kind": {}}
+_question_ids = itertools.count(1)
+_rng = random.Random()
+
+
+def sample_latency():
+    if config["latency_ms"] <= 0:
+        return 0.0
+    return config["latency_ms"] / 1000 * _rng.lognormvariate(0, config["sigma"])
+
+
+def prompt_text(body):
+    return " ".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+
+
+def canned_reply(prompt):
+    if "grading several answers" in prompt:
+        ids = [int(i) for i in BATCH_ID_RE.findall(prompt)]
+        return "batch", json.dumps([
+            {"id": i, "score": _rng.randint(3, 9), "feedback": "Stub feedback for this answer.", "correct_solution": "Stub solution."}
+            for i in ids
+        ])
+    if '"score"' in prompt:
+        return "evaluation", json.dumps({
+            "score": _rng.randint(3, 9),
+            "feedback": "Reasonable answer; mention trade-offs and an example next time.",
+            "correct_solution": "A stub reference solution.",
+        })
+    return "question", f"Stub question #{next(_question_ids)}: explain how you would design and test a rate limiter?"
+
+
+def response_body(text):
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": 1, "index": 0}],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": len(text) // 4, "totalTokenCount": len(text) // 4},
+    }
+
+
+def throttled():
+    return JSONResponse(status_code=429, content={"error": {
+        "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded (stub-injected 429)",
+    }})
+
+
+@app.post("/v1beta/models/{model_method:path}")
+async def generate(model_method: str, request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if _rng.random() < config["rate_429"]:
+        stats["throttled"] += 1
+        return throttled()
+
+    kind, text = canned_reply(prompt_text(body))
+    stats["by_kind"][kind] = stats["by_kind"].get(kind, 0) + 1
+    latency = sample_latency()
+
+    if model_method.endswith(":streamGenerateContent"):
+        stats["streamed"] += 1
+        size = -(-len(text) // STREAM_CHUNKS)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+        async def chunks():
+            # The SDK's REST transport parses a streamed JSON array
+            yield "["
+            for n, piece in enumerate(pieces):
+                await asyncio.sleep(latency / len(pieces))
+                yield ("," if n else "") + json.dumps(response_body(piece))
+            yield "]"
+
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    await asyncio.sleep(latency)
+    return JSONResponse(response_body(text))
+
+
+@app.get("/stats")
+def get_stats():
+    return {"config": config, **stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="median latency per call")
+    parser.add_argument("--sigma", type=float, default=0.4, help="log-normal shape; 0 = fixed latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config.update(latency_ms=args.latency_ms, sigma=args.sigma, rate_429=args.rate_429, seed=args.seed)
+    _rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,61 @@
 import streamlit as st
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 API_URL = "http://localhost:8000"
+USER_ID = "user"
+# Past interviews are re-listed at most this often
+MY_SESSIONS_TTL = 30
+REQUEST_TIMEOUT = 120
+
+
+@st.cache_resource
+def get_http():
+    """One keep-alive session for every rerun and browser tab, instead of a new TCP connection per call."""
+    http = requests.Session()
+    # Room for several tabs plus their background question fetches
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    return http
+
+
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="next-question")
+
+
+def fetch_question(http, session_id):
+    """
+    The next question's JSON, or None. Also runs on the prefetch thread, which has
+    no script-run context: no st.* calls (get_http included) in here.
+    """
+    res = http.get(f"{API_URL}/get_question/{session_id}", timeout=REQUEST_TIMEOUT)
+    return res.json() if res.status_code == 200 else None
+
+
+def prefetch_next_question():
+    # Started as soon as the feedback is shown; the API is already generating it by then
+    # The session is resolved here, on the script thread, and handed to the worker
+    st.session_state['next_q'] = get_executor().submit(fetch_question, get_http(), st.session_state['session_id'])
+
+
+def take_next_question():
+    """The background-fetched question (waits if still in flight), else a direct fetch."""
+    future = st.session_state.pop('next_q', None)
+    if future is not None:
+        try:
+            return future.result(timeout=REQUEST_TIMEOUT)
+        except Exception:
+            pass
+    return fetch_question(get_http(), st.session_state['session_id'])
+
+
+@st.cache_data(ttl=MY_SESSIONS_TTL, show_spinner=False)
+def fetch_my_sessions(user_id):
+    res = get_http().get(f"{API_URL}/my_sessions/{user_id}", params={"limit": 10}, timeout=REQUEST_TIMEOUT)
+    return res.json().get("sessions", []) if res.status_code == 200 else []
 
 # --- TAILWIND-STYLE CSS ---
 st.markdown("""
@@ -59,26 +113,39 @@ with st.sidebar:
     )
     
     if st.button("Start New Interview"):
-        res = requests.post(f"{API_URL}/start_interview", json={"user_id": "user"})
+        res = get_http().post(f"{API_URL}/start_interview", json={"user_id": USER_ID}, timeout=REQUEST_TIMEOUT)
         if res.status_code == 200:
             st.session_state['session_id'] = res.json()['session_id']
             st.session_state['current_q'] = None
+            st.session_state['last_result'] = None
+            st.session_state.pop('next_q', None)
             st.session_state['score_history'] = []
+            # The new interview should show up in the list right away
+            fetch_my_sessions.clear()
             st.success("New Session Started")
             st.rerun()
 
+    with st.expander("🗂️ Past Interviews"):
+        past = fetch_my_sessions(USER_ID)
+        if not past:
+            st.caption("No interviews yet.")
+        for s in past:
+            st.markdown(f"**{s.get('topic') or 'General'}** • {s.get('questions_count') or 0} questions • {s.get('difficulty')}  \n"
+                        f"<span style='color: #64748b; font-size: 0.8rem;'>{(s.get('created_at') or '')[:16].replace('T', ' ')}</span>",
+                        unsafe_allow_html=True)
+
 # --- MAIN INTERFACE ---
 if 'session_id' in st.session_state:
     
     # Fetch Question if none exists
     if st.session_state.get('current_q') is None:
-        res = requests.get(f"{API_URL}/get_question/{st.session_state['session_id']}")
-        if res.status_code == 200:
-            st.session_state['current_q'] = res.json()
-        else:
+        with st.spinner("Fetching question..."):
+            st.session_state['current_q'] = take_next_question()
+        if st.session_state['current_q'] is None:
             st.error("Could not fetch question.")
 
     q_data = st.session_state.get('current_q')
+    result = st.session_state.get('last_result')
 
     if q_data:
         # Display Topic Badge
@@ -90,52 +157,59 @@ if 'session_id' in st.session_state:
         
         st.markdown(f"### Q: {q_data['question']}")
         
-        user_answer = st.text_area("Your Answer:", height=200, placeholder="Type your answer here...")
-        
-        if st.button("Submit Answer"):
-            if user_answer:
-                payload = {
-                    "session_id": st.session_state['session_id'],
-                    "question_id": q_data['id'],
-                    "answer": user_answer,
-                    "question_text": q_data['question'],
-                    "expected_answer": q_data['expected_answer'],
-                    "language": language
-                }
-                
-                with st.spinner("🤖 AI is evaluating..."):
-                    res = requests.post(f"{API_URL}/submit_answer", json=payload)
-                    result = res.json()
-                
-                # Result Section
-                st.markdown("---")
-                st.markdown("### 📝 Feedback")
-                
-                # Color code score
-                score = result['score']
-                color = "#16a34a" if score >= 7 else "#ca8a04" if score >= 4 else "#dc2626"
-                
-                st.markdown(f"""
-                <div style="padding: 1rem; background-color: white; border-left: 5px solid {color}; border-radius: 0.375rem; box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1);">
-                    <h2 style="margin:0; color: {color};">Score: {score}/10</h2>
-                    <p style="margin-top: 0.5rem; font-size: 1.1rem;">{result['feedback']}</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.info(f"Next Difficulty Level: {result['next_difficulty']}")
-                
-                with st.expander("👁️ View Correct Solution"):
-                    st.code(result['correct_solution'])
-                
-                if st.button("Next Question ➡️"):
-                    st.session_state['current_q'] = None
-                    st.rerun()
-            else:
-                st.warning("Please type an answer first.")
+        if result is None:
+            user_answer = st.text_area("Your Answer:", height=200, placeholder="Type your answer here...")
+            
+            if st.button("Submit Answer"):
+                if user_answer:
+                    payload = {
+                        "session_id": st.session_state['session_id'],
+                        "answer": user_answer,
+                        "question_text": q_data['question'],
+                        "language": language
+                    }
+                    
+                    with st.spinner("🤖 AI is evaluating..."):
+                        res = get_http().post(f"{API_URL}/submit_answer", json=payload, timeout=REQUEST_TIMEOUT)
+                        result = res.json()
+                    st.session_state['last_result'] = result
+                    st.session_state['score_history'].append(result['score'])
+                    prefetch_next_question()
+                    # The list's question count changed
+                    fetch_my_sessions.clear()
+                else:
+                    st.warning("Please type an answer first.")
+
+        if result is not None:
+            # Result Section
+            st.markdown("---")
+            st.markdown("### 📝 Feedback")
+            
+            # Color code score
+            score = result['score']
+            color = "#16a34a" if score >= 7 else "#ca8a04" if score >= 4 else "#dc2626"
+            
+            st.markdown(f"""
+            <div style="padding: 1rem; background-color: white; border-left: 5px solid {color}; border-radius: 0.375rem; box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1);">
+                <h2 style="margin:0; color: {color};">Score: {score}/10</h2>
+                <p style="margin-top: 0.5rem; font-size: 1.1rem;">{result['feedback']}</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            st.info(f"Next Difficulty Level: {result['next_difficulty']}")
+            
+            with st.expander("👁️ View Correct Solution"):
+                st.code(result['correct_solution'])
+            
+            # Outside the Submit branch, so the click survives the rerun it triggers
+            if st.button("Next Question ➡️"):
+                st.session_state['current_q'] = None
+                st.session_state['last_result'] = None
+                st.rerun()
 else:
     st.markdown("""
     <div style="text-align: center; padding: 50px; color: #64748b;">
         <h3>👋 Welcome!</h3>
         <p>Select a language in the sidebar and click <b>Start New Interview</b> to begin.</p>
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
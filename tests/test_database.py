@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "test_database.db"))
+
+from api import database
+
+HEADER = [{"meta": "init", "topic": "DBMS", "level": "Fresher"}]
+
+
+def turn(n):
+    return {"question": f"Question {n}?", "answer": f"Answer {n}", "score": 5, "feedback": f"Feedback {n}"}
+
+
+@pytest.fixture
+def session_id(request):
+    database.ensure_schema()
+    database._session_cache = database.SessionCache(64)
+    session_id = f"test-{request.node.name}-{os.urandom(4).hex()}"
+    database.update_session(session_id, "Easy", HEADER, user_id="test")
+    return session_id
+
+
+def test_turn_appended_between_reads_is_not_cached_under_old_version(session_id, monkeypatch):
+    """
+    get_session reads the version, another request commits a turn, get_session
+    reads the turns, and only then does that request's advance() reach the cache.
+    """
+    original = database.db_connection
+    cache = database._session_cache
+    deferred = []
+
+    class Cursor:
+        def __init__(self, cursor):
+            self._cursor = cursor
+
+        def execute(self, sql, *args):
+            if sql.lstrip().startswith("SELECT question") and not deferred:
+                # Another worker thread commits a turn; its cache update lands later
+                monkeypatch.setattr(cache, "advance", lambda *a: deferred.append(a))
+                worker = threading.Thread(target=database.append_turn, args=(session_id, "Easy", turn(1)))
+                worker.start()
+                worker.join()
+                monkeypatch.undo()
+            return self._cursor.execute(sql, *args)
+
+        def __getattr__(self, name):
+            return getattr(self._cursor, name)
+
+    class Connection:
+        def __init__(self, conn):
+            self._conn = conn
+
+        def cursor(self, *args, **kwargs):
+            return Cursor(self._conn.cursor(*args, **kwargs))
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+    @contextmanager
+    def racing_connection():
+        with original() as (conn, db_type):
+            yield Connection(conn), db_type
+
+    # A cold read, e.g. on another worker than the one that created the session
+    cache.invalidate(session_id)
+    database.db_connection = racing_connection
+    try:
+        database.get_session(session_id)
+    finally:
+        database.db_connection = original
+    assert deferred
+    cache.advance(*deferred[0])
+
+    _, history = database.get_session(session_id)
+    assert [h["question"] for h in history[1:]] == ["Question 1?"]
+
+
+def test_concurrent_appends_get_distinct_turn_numbers(session_id):
+    """Exercises the Postgres row lock when DATABASE_URL is set; SQLite serializes writers anyway."""
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def append(n):
+        barrier.wait()
+        try:
+            database.append_turn(session_id, "Easy", turn(n))
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=append, args=(n,)) for n in range(8)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    assert errors == []
+    database._session_cache.invalidate(session_id)
+    _, history = database.get_session(session_id)
+    assert sorted(h["question"] for h in history[1:]) == sorted(f"Question {n}?" for n in range(8))
+
+
+def test_append_to_unknown_session_writes_no_turn():
+    database.ensure_schema()
+    session_id = f"test-missing-{os.urandom(4).hex()}"
+    database.append_turn(session_id, "Easy", turn(1))
+
+    with database.db_connection() as (conn, db_type):
+        placeholder = "%s" if db_type == "postgres" else "?"
+        c = conn.cursor()
+        c.execute(f"SELECT COUNT(*) AS n FROM session_turns WHERE session_id={placeholder}", (session_id,))
+        assert c.fetchone()["n"] == 0
@@ -0,0 +1,64 @@
+import json
+import os
+import pickle
+
+import faiss
+import numpy as np
+import pytest
+
+from api.rag import ann_index, ingest
+from api.rag.metadata_store import ColumnarMetadata
+
+
+@pytest.fixture
+def bank(tmp_path):
+    """A base file plus one shard, with every embedding already cached so the model is never loaded."""
+    items = [{"id": i, "question": f"Question {i}?", "topic": ["SQL", "OS", "CN"][i % 3],
+              "difficulty": ["Easy", "Medium", "Medium/Hard"][i % 3]} for i in range(300)]
+    data_path = tmp_path / "questions.json"
+    data_path.write_text(json.dumps(items[:200]))
+    shards_dir = tmp_path / "shards"
+    shards_dir.mkdir()
+    (shards_dir / "0001.jsonl").write_text("".join(json.dumps(item) + "\n" for item in items[200:]))
+
+    cache = ingest.EmbeddingCache(str(tmp_path / "cache.db"))
+    rng = np.random.default_rng(0)
+    cache.put_many([ingest.content_hash(item) for item in items], ann_index.normalize(rng.random((len(items), 16))))
+    cache.close()
+
+    paths = {name: str(tmp_path / name) for name in ("index.faiss", "metadata.pkl", "metadata.cols", "cache.db")}
+    run = lambda: ingest.ingest_data(str(data_path), paths["index.faiss"], paths["metadata.pkl"], paths["cache.db"],
+                                     full=True, columns_path=paths["metadata.cols"], shards_dir=str(shards_dir))
+    return items, paths, run
+
+
+def check_outputs(items, paths):
+    with open(paths["metadata.pkl"], "rb") as f:
+        assert pickle.load(f) == items
+    columns = ColumnarMetadata(paths["metadata.cols"])
+    assert list(columns) == items
+    assert columns[123] == items[123]
+    assert [int(i) for i in columns.inverted_lists()[1]["os"]] == list(range(1, 300, 3))
+
+    index = faiss.read_index(paths["index.faiss"])
+    assert index.ntotal == len(items)
+    assert sorted(faiss.vector_to_array(index.id_map).tolist()) == list(range(len(items)))
+    assert not [p for p in os.listdir(os.path.dirname(paths["metadata.pkl"])) if ".tmp-" in p]
+    return index
+
+
+def test_rebuild_streams_chunks(bank, monkeypatch):
+    items, paths, run = bank
+    monkeypatch.setattr(ingest, "INGEST_REBUILD_CHUNK_SIZE", 64)
+    run()
+    assert ann_index.index_kind(check_outputs(items, paths)) == "flat"
+
+
+def test_ivf_rebuild_trains_on_buffered_chunks(bank, monkeypatch):
+    items, paths, run = bank
+    monkeypatch.setattr(ingest, "INGEST_REBUILD_CHUNK_SIZE", 64)
+    monkeypatch.setattr(ann_index, "FLAT_MAX_VECTORS", 0)
+    monkeypatch.setattr(ann_index, "HNSW_MAX_VECTORS", 0)
+    monkeypatch.setattr(ann_index, "IVF_TRAIN_PER_LIST", 2)
+    run()
+    assert ann_index.index_kind(check_outputs(items, paths)) == "ivf"
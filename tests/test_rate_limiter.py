@@ -0,0 +1,12 @@
+from api.rate_limiter import GeminiLimiter
+
+
+def test_waiting_on_tpm_does_not_drain_rpm():
+    limiter = GeminiLimiter(rpm=15, tpm=1000, shared=False, max_wait=0.2)
+    assert limiter.acquire(900)
+    limiter.release("success")
+    before = limiter.rpm.available()
+
+    # Over the TPM budget: every poll takes an RPM slot, which must be handed back
+    assert not limiter.acquire(900)
+    assert limiter.rpm.available() >= before
@@ -0,0 +1,66 @@
+import asyncio
+
+from api.single_flight import SingleFlight
+
+
+def test_cancelling_sole_waiter_cancels_upstream():
+    state = {"cancelled": False, "finished": False}
+
+    async def upstream():
+        try:
+            await asyncio.sleep(1)
+            state["finished"] = True
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def main():
+        flight = SingleFlight()
+        caller = asyncio.create_task(flight.do_async("k", upstream, timeout=5))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        return flight.stats()
+
+    stats = asyncio.run(main())
+    assert state == {"cancelled": True, "finished": False}
+    assert stats["abandoned"] == 1 and stats["in_flight"] == 0
+
+
+def test_upstream_survives_while_another_waiter_remains():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do_async("k", upstream, timeout=5))
+        second = asyncio.create_task(flight.do_async("k", upstream, timeout=5))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "answer"
+    assert calls == [1]
+
+
+def test_sole_waiter_timeout_cancels_upstream():
+    state = {"cancelled": False}
+
+    async def upstream():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def main():
+        result = await SingleFlight().do_async("k", upstream, timeout=0.05, default="fallback")
+        await asyncio.sleep(0.02)
+        return result
+
+    assert asyncio.run(main()) == "fallback"
+    assert state["cancelled"]